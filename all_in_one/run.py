@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import asyncio
+import threading
+import obsws_python as obs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.obs_client import SharedReqClient
+from obs_director import app as director
+
+config = None
+with open("../config.json", "r") as file:
+    config = json.load(file)
+
+RUNTIME_CONFIG = config.get("all_in_one", {})
+# Services hosted in this process; anything left out is reached over HTTP as usual
+SERVICES = RUNTIME_CONFIG.get("services", ["interesting_scene", "lyrics_shown", "bpm", "ptz_moving"])
+# Also serve the detectors' HTTP endpoints, for consumers outside this process
+SERVE_HTTP = RUNTIME_CONFIG.get("http", False)
+
+def serve_flask(app, port):
+    """Run a detector's Flask app on its usual port in a background thread."""
+    thread = threading.Thread(target=app.run, kwargs={"host": "0.0.0.0", "port": port, "debug": False})
+    thread.daemon = True
+    thread.start()
+
+async def main():
+    # One OBS request connection shared by the detectors and one event connection shared by everyone.
+    # The director gets a request connection of its own, so a beat-timed cut never queues behind a
+    # detector's screenshot.
+    websocket = config["obs"]["websocket"]
+    cl = SharedReqClient(obs.ReqClient(host=websocket["host"], port=websocket["port"], password=websocket["password"], timeout=3))
+    director_cl = obs.ReqClient(host=websocket["host"], port=websocket["port"], password=websocket["password"], timeout=3)
+    events = obs.EventClient(host=websocket["host"], port=websocket["port"], password=websocket["password"], timeout=3)
+    print("Connected to OBS WebSocket")
+
+    # StateBroadcaster, Readiness (and check function) of every hosted detector, read by the director in memory
+    local_signals = {}
+    ptz_runner = None
+    try:
+        # The detector loops block on OBS, the model and the audio device, so each
+        # runs on its own thread as in the standalone services; the model libraries
+        # release the GIL while they work.
+        if "interesting_scene" in SERVICES:
+            from interesting_scene import server as interesting_scene
+            interesting_scene.start(cl, events)
+            local_signals["scene_interest"] = (interesting_scene.status_broadcaster, interesting_scene.readiness,
+                                               interesting_scene.check_scene)
+            if SERVE_HTTP:
+                serve_flask(interesting_scene.app, 3853)
+
+        if "lyrics_shown" in SERVICES:
+            from lyrics_shown import server as lyrics_shown
+            lyrics_shown.connect(cl)
+            capture_thread = threading.Thread(target=lyrics_shown.capture_loop)
+            capture_thread.daemon = True
+            capture_thread.start()
+            local_signals["lyrics"] = (lyrics_shown.lyrics_broadcaster, lyrics_shown.readiness)
+            if SERVE_HTTP:
+                serve_flask(lyrics_shown.app, 4932)
+
+        if "bpm" in SERVICES:
+            from bpm import server as bpm
+            bpm.start()
+            local_signals["bpm"] = (bpm.bpm_broadcaster, bpm.readiness)
+            local_signals["beats"] = (bpm.beat_broadcaster, bpm.readiness)
+            if SERVE_HTTP:
+                serve_flask(bpm.app, 3962)
+
+        if "ptz_moving" in SERVICES:
+            from ptz_moving import server as ptz_moving
+            # Always served: camera controllers report moves over HTTP
+            ptz_runner = await ptz_moving.start()
+            local_signals["ptz_moving"] = (ptz_moving.ptz_broadcaster, ptz_moving.readiness)
+
+        print(f"Hosting {', '.join(SERVICES)} with the director")
+        await director.main(director_cl, events, local_signals)
+    finally:
+        if ptz_runner is not None:
+            await ptz_runner.cleanup()
+        events.disconnect()
+        director_cl.disconnect()
+        cl.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import math
+import numpy as np
+
+
+class BeatTracker:
+    """
+    Keeps a continuous beat grid (phase, period and downbeat) from the beat
+    positions `librosa.beat.beat_track` finds, and predicts upcoming beats
+    as wall-clock timestamps.
+
+    A straight line is fitted through the most recent beat times; its slope
+    is the beat period and its residual spread drives the confidence. The
+    downbeat is taken to be the beat position within the bar (assuming
+    `beats_per_bar` beats) with the strongest average onset.
+    """
+
+    def __init__(self, beats_per_bar=4, history=8):
+        self.beats_per_bar = beats_per_bar
+        self.history = history
+        self.bpm = None
+        self.period = None
+        self.beat_time = None
+        self.downbeat_time = None
+        self.confidence = 0.0
+        self.updated = None
+
+    def update(self, beat_times, onset_strengths, now):
+        """Refit the grid from wall-clock beat times and the onset strength at each beat."""
+        beat_times = np.asarray(beat_times, dtype=np.float64)[-self.history:]
+        onset_strengths = np.asarray(onset_strengths, dtype=np.float64)[-self.history:]
+        if len(beat_times) < 3:
+            self.confidence = 0.0
+            return
+
+        index = np.arange(len(beat_times))
+        period, intercept = np.polyfit(index, beat_times, 1)
+        if period <= 0:
+            self.confidence = 0.0
+            return
+        jitter = np.std(beat_times - (intercept + period * index))
+
+        # A beat that wobbles by 10% of the period is as good as no beat at all
+        regularity = max(0.0, 1.0 - jitter / (0.1 * period))
+        coverage = min(1.0, len(beat_times) / self.history)
+
+        bar_position = index % self.beats_per_bar
+        strength = [onset_strengths[bar_position == position].mean() for position in range(self.beats_per_bar)]
+        downbeat_position = int(np.argmax(strength))
+        last_downbeat = index[bar_position == downbeat_position][-1]
+
+        self.period = float(period)
+        self.bpm = 60.0 / self.period
+        self.beat_time = float(intercept + period * index[-1])
+        self.downbeat_time = float(intercept + period * last_downbeat)
+        self.confidence = round(float(regularity * coverage), 3)
+        self.updated = now
+
+    def next_beats(self, now, count=4, every=1):
+        """The next `count` predicted beats after `now` (every `every`th beat, starting at the grid's downbeat if every > 1)."""
+        if self.period is None:
+            return []
+        anchor = self.beat_time if every == 1 else self.downbeat_time
+        step = self.period * every
+        first = anchor + math.ceil((now - anchor) / step) * step
+        return [round(first + step * n, 4) for n in range(count)]
+
+    def grid(self):
+        """Compact description of the grid that a client can extrapolate from itself."""
+        return {
+            "bpm": round(self.bpm, 2) if self.bpm else None,
+            "period": self.period,
+            "beat_time": self.beat_time,
+            "downbeat_time": self.downbeat_time,
+            "beats_per_bar": self.beats_per_bar,
+            "confidence": self.confidence,
+            "updated": self.updated,
+        }
@@ -0,0 +1,78 @@
+import math
+import time
+import numpy as np
+
+
+class MusicGate:
+    """
+    Cheap music/silence detector that runs on every block of the audio
+    callback.
+
+    Each block is downmixed to mono, windowed and passed through one real
+    FFT. Two numbers come out of the power spectrum: the level of the music
+    band (`band`, in dBFS) and the share of that energy below `bass_cutoff`.
+    Silence fails the level test. Speech through a vocal mic carries little
+    energy below ~150 Hz, so it fails the bass test. The state only flips
+    once `hold_time` seconds of blocks in a row agree, so a pause between
+    songs or a loud word doesn't toggle it.
+    """
+
+    def __init__(self, samplerate, band=(40, 8000), bass_cutoff=150, threshold_db=-45.0,
+                 min_bass_share=0.1, hold_time=2.0):
+        self.samplerate = samplerate
+        self.band = band
+        self.bass_cutoff = bass_cutoff
+        self.threshold_db = threshold_db
+        self.min_bass_share = min_bass_share
+        self.hold_time = hold_time
+
+        self.music_playing = False
+        self.changed_time = time.time()  # When music_playing last flipped
+        self.level_db = -120.0
+        self.bass_share = 0.0
+        self._disagreeing = 0  # Consecutive blocks disagreeing with the current state
+        self._block_size = None
+
+    def _prepare(self, block_size):
+        # Window, band bins and hold count depend on the block size, so set them up on the first block
+        self._block_size = block_size
+        self._window = np.hanning(block_size).astype(np.float32)
+        self._mono = np.empty(block_size, dtype=np.float32)
+        bin_width = self.samplerate / block_size
+        self._band_bins = slice(int(self.band[0] / bin_width), int(self.band[1] / bin_width) + 1)
+        self._bass_bins = slice(self._band_bins.start, int(self.bass_cutoff / bin_width) + 1)
+        # Scales the summed power of a band to the mean square of the signal in that band
+        self._power_scale = 2.0 / (block_size * float(np.sum(self._window ** 2)))
+        self._hold_blocks = max(1, math.ceil(self.hold_time * self.samplerate / block_size))
+
+    def write(self, block):
+        """Classify a (frames, channels) block. Safe to call from the audio callback."""
+        if len(block) != self._block_size:
+            self._prepare(len(block))
+        if block.ndim > 1:
+            np.mean(block, axis=1, out=self._mono)
+        else:
+            self._mono[:] = block
+        self._mono *= self._window
+        power = np.abs(np.fft.rfft(self._mono)) ** 2
+
+        band_power = float(power[self._band_bins].sum())
+        bass_power = float(power[self._bass_bins].sum())
+        self.level_db = 10.0 * math.log10(band_power * self._power_scale + 1e-12)
+        self.bass_share = bass_power / band_power if band_power > 0 else 0.0
+        is_music = self.level_db > self.threshold_db and self.bass_share >= self.min_bass_share
+
+        if is_music == self.music_playing:
+            self._disagreeing = 0
+            return
+        self._disagreeing += 1
+        if self._disagreeing >= self._hold_blocks:
+            self.music_playing = is_music
+            self.changed_time = time.time()
+            self._disagreeing = 0
+
+    def playing_for(self, now=None):
+        """Seconds music has been playing without a break (0 if it isn't)."""
+        if not self.music_playing:
+            return 0.0
+        return (now or time.time()) - self.changed_time
@@ -1,18 +1,36 @@
+import os
+import sys
 import sounddevice as sd
-import numpy as np
-import librosa
+import time
 from collections import deque
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics
+from common.events import StateBroadcaster
+from common.readiness import Readiness
+from bpm.beats import BeatTracker
+from bpm.music_gate import MusicGate
+
 # Parameters
 INPUT_DEVICE = 1
 BUFFER_DURATION = 15  # seconds
 SAMPLERATE = 44100
 ROLLING_AVERAGE_WINDOW = 5  # Number of BPM values to average
+ANALYSIS_RATE = 22050  # Audio is downmixed and decimated to about this rate before analysis
+TEMPO_INTERVAL = 1.0  # seconds between tempo estimates
+BEATS_PER_BAR = 4
+MUSIC_SETTLE_TIME = 5  # Seconds of music before tempo estimates resume, so the window isn't mostly speech
+# librosa's numba functions are compiled on first use; keep the compiled code between runs
+NUMBA_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".cache", "numba")
+
+# Incremental onset envelope over the last BUFFER_DURATION seconds of audio.
+# Created by the audio thread, so importing librosa doesn't hold up the web server
+tempo_estimator = None
 
-# Rolling buffer for audio data
-audio_buffer = deque(maxlen=int(SAMPLERATE * BUFFER_DURATION))
+# Music/silence gate on the same audio stream; tempo estimation is suspended while it's closed
+music_gate = MusicGate(SAMPLERATE)
 
 # Rolling buffer for BPM values
 bpm_history = deque(maxlen=ROLLING_AVERAGE_WINDOW)
@@ -20,42 +38,142 @@ bpm_history = deque(maxlen=ROLLING_AVERAGE_WINDOW)
 # Shared state for BPM values
 current_bpm = None
 rolling_avg_bpm = None
+bpm_broadcaster = StateBroadcaster()
+
+# Beat phase of the music, as predicted wall-clock beat/downbeat times
+beat_tracker = BeatTracker(beats_per_bar=BEATS_PER_BAR)
+beat_broadcaster = StateBroadcaster()
+
+# Ready once the music gate has had time to tell music from silence
+readiness = Readiness("bpm")
+
+TEMPO_SECONDS = metrics.histogram("tempo_estimate_seconds", "One tempo and beat estimate over the onset envelope (detect_bpm)")
+ONSET_SECONDS = metrics.histogram("onset_process_seconds", "Extending the onset envelope with newly arrived audio")
+AUDIO_STATUS = metrics.counter("audio_input_status_total", "Audio callbacks reporting an input problem (overflow etc.)")
+BPM_GAUGE = metrics.gauge("bpm", "Latest detected BPM")
+MUSIC_GAUGE = metrics.gauge("music_playing", "1 while the music gate detects music")
 
 # Flask app setup
 app = Flask(__name__)
 
 @app.route("/bpm", methods=["GET"])
 def get_bpm():
-    """Return the current and rolling average BPM as JSON."""
+    """Return the current and rolling average BPM and whether music is playing as JSON."""
+    return jsonify(bpm_state())
+
+@app.route("/events", methods=["GET"])
+def stream_bpm():
+    """Stream every BPM change as Server-Sent Events."""
+    return Response(bpm_broadcaster.sse_stream(), mimetype="text/event-stream")
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus metrics of the audio pipeline."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/ready", methods=["GET"])
+def get_ready():
+    """200 once music_playing can be trusted, 503 while librosa is loading or the gate is settling."""
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route("/beats", methods=["GET"])
+def get_beats():
+    """Return the beat grid and the next predicted beats and downbeats (Unix timestamps)."""
+    now = time.time()
     return jsonify({
-        "current_bpm": current_bpm,
-        "rolling_average_bpm": rolling_avg_bpm
+        **beat_tracker.grid(),
+        "next_beats": beat_tracker.next_beats(now, count=8),
+        "next_downbeats": beat_tracker.next_beats(now, count=4, every=BEATS_PER_BAR),
     })
 
+@app.route("/beats/events", methods=["GET"])
+def stream_beats():
+    """Stream every beat grid update as Server-Sent Events."""
+    return Response(beat_broadcaster.sse_stream(), mimetype="text/event-stream")
+
+def bpm_state():
+    return {
+        "current_bpm": current_bpm,
+        "rolling_average_bpm": rolling_avg_bpm,
+        "music_playing": music_gate.music_playing,
+    }
+
 # Beat detection function
-def detect_bpm(audio_data, samplerate):
-    onset_env = librosa.onset.onset_strength(y=audio_data, sr=samplerate)
-    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=samplerate)
+def detect_bpm():
+    with TEMPO_SECONDS.time():
+        tempo, beats = tempo_estimator.estimate()
+    # Re-anchor the beat grid on the beats found in the latest window
+    beat_tracker.update(tempo_estimator.frame_times(beats), tempo_estimator.envelope()[beats], time.time())
+    beat_broadcaster.publish(beat_tracker.grid())
     return tempo
 
 # Audio callback function
 def audio_callback(indata, frames, time, status):
     if status:
+        AUDIO_STATUS.inc()
         print(status)
-    # Append new audio data to the rolling buffer
-    audio_buffer.extend(indata[:, 0])
+    # Hand the new audio to the estimator's ring buffer
+    tempo_estimator.write(indata)
+    music_gate.write(indata)
+
+# Import librosa, build the estimator and compile beat tracking ahead of the first estimate
+def load_tempo_estimator():
+    global tempo_estimator
+    readiness.set_stage("loading librosa")
+    os.environ.setdefault("NUMBA_CACHE_DIR", NUMBA_CACHE_DIR)
+    from bpm.tempo import StreamingTempoEstimator
+    estimator = StreamingTempoEstimator(SAMPLERATE, analysis_rate=ANALYSIS_RATE, buffer_duration=BUFFER_DURATION)
+    readiness.set_stage("warming up")
+    estimator.warm_up()
+    tempo_estimator = estimator
 
 # Function to process audio and update BPM values
 def process_audio_stream():
     global current_bpm, rolling_avg_bpm
-    with sd.InputStream(device=INPUT_DEVICE, channels=2, samplerate=SAMPLERATE, callback=audio_callback):
+    load_tempo_estimator()
+    # Blocks that divide evenly by the decimation factor keep the downsampling exact
+    blocksize = tempo_estimator.hop_length * tempo_estimator.decimation
+    last_estimate_time = 0
+    music_playing = music_gate.music_playing
+    with sd.InputStream(device=INPUT_DEVICE, channels=2, samplerate=SAMPLERATE, blocksize=blocksize, callback=audio_callback) as stream:
+        # Beat timestamps are shifted back by the time audio spends in the input buffer
+        tempo_estimator.input_latency = stream.latency
         print("Listening for beats...")
+        readiness.set_stage("listening")
+        stream_opened = time.time()
         while True:
-            if len(audio_buffer) == SAMPLERATE * BUFFER_DURATION:
-                # Process the last BUFFER_DURATION seconds of audio
-                audio_data = np.array(audio_buffer)
-                bpm = detect_bpm(audio_data, SAMPLERATE)
-                bpm = int(bpm[0])  # Convert detected tempo to an integer
+            # Sleep until the audio callback delivers more samples
+            tempo_estimator.new_audio.wait(1)
+            tempo_estimator.new_audio.clear()
+
+            # Extend the onset envelope by the new hops only
+            with ONSET_SECONDS.time():
+                tempo_estimator.process()
+
+            if not readiness.ready and time.time() - stream_opened >= music_gate.hold_time:
+                # music_playing now reflects the audio rather than the default
+                readiness.set_ready()
+                bpm_broadcaster.publish(bpm_state())
+
+            if music_gate.music_playing != music_playing:
+                music_playing = music_gate.music_playing
+                MUSIC_GAUGE.set(int(music_playing))
+                print("Music detected" if music_playing else "No music detected, pausing tempo estimation")
+                if not music_playing:
+                    # The next song starts a fresh average
+                    bpm_history.clear()
+                    current_bpm = rolling_avg_bpm = None
+                bpm_broadcaster.publish(bpm_state())
+
+            # Tempo is meaningless during speech and silence, so don't spend CPU on it
+            if music_gate.playing_for() < MUSIC_SETTLE_TIME:
+                continue
+
+            if tempo_estimator.envelope_full and time.time() - last_estimate_time >= TEMPO_INTERVAL:
+                last_estimate_time = time.time()
+                # Estimate the tempo over the last BUFFER_DURATION seconds of onsets
+                bpm = int(detect_bpm())  # Convert detected tempo to an integer
                 
                 # Add BPM to the history and calculate the rolling average
                 bpm_history.append(bpm)
@@ -64,11 +182,15 @@ def process_audio_stream():
                 # Update shared state
                 current_bpm = bpm
                 rolling_avg_bpm = avg_bpm
+                BPM_GAUGE.set(bpm)
+                bpm_broadcaster.publish(bpm_state())
 
-# Start audio processing in a separate thread
-audio_thread = threading.Thread(target=process_audio_stream, daemon=True)
-audio_thread.start()
+def start():
+    """Start audio processing in a separate thread."""
+    audio_thread = threading.Thread(target=process_audio_stream, daemon=True)
+    audio_thread.start()
 
 # Start the Flask web server
 if __name__ == "__main__":
+    start()
     app.run(host="0.0.0.0", port=3962, debug=False)
@@ -0,0 +1,136 @@
+import time
+import threading
+import numpy as np
+import librosa
+
+
+class StreamingTempoEstimator:
+    """
+    Incremental onset envelope and tempo estimation over a live audio stream.
+
+    Incoming audio is downmixed to mono, decimated to roughly `analysis_rate`
+    and written into a preallocated ring. Every time a full hop of new audio
+    is available, one frame of the onset envelope is computed (the same
+    mel spectral flux `librosa.onset.onset_strength` uses) and appended to a
+    second ring that holds the last `buffer_duration` seconds of envelope.
+    Tempo is then estimated from the cached envelope, so only a few
+    milliseconds of new audio have to be analysed per hop instead of
+    recomputing the whole window.
+    """
+
+    def __init__(self, samplerate, analysis_rate=22050, buffer_duration=15, n_fft=2048,
+                 hop_length=512, n_mels=128, top_db=80.0):
+        self.decimation = max(1, int(samplerate // analysis_rate))
+        self.analysis_rate = samplerate / self.decimation
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.top_db = top_db
+
+        # Raw (analysis rate) audio ring; holds a couple of seconds ahead of the envelope
+        self._audio = np.zeros(max(n_fft * 4, int(self.analysis_rate * 2)), dtype=np.float32)
+        self._written = 0  # Total samples ever written
+        self._anchor_time = 0.0  # Wall-clock time at which the last written sample arrived
+        self.input_latency = 0.0  # Seconds between a sample hitting the input and reaching the callback
+        self._next_frame = 0  # Start sample of the next STFT frame to analyse
+        self._lock = threading.Lock()
+        self.new_audio = threading.Event()
+
+        self._window = librosa.filters.get_window("hann", n_fft, fftbins=True).astype(np.float32)
+        self._mel_basis = librosa.filters.mel(sr=self.analysis_rate, n_fft=n_fft, n_mels=n_mels).astype(np.float32)
+        self._frame = np.zeros(n_fft, dtype=np.float32)
+        self._previous_db = None
+
+        # Onset envelope ring covering the last buffer_duration seconds
+        self._envelope = np.zeros(int(buffer_duration * self.analysis_rate / hop_length), dtype=np.float32)
+        self._envelope_ordered = np.empty_like(self._envelope)
+        self.frames_analysed = 0
+
+    @property
+    def envelope_full(self):
+        return self.frames_analysed >= len(self._envelope)
+
+    def write(self, block):
+        """Add a (frames, channels) block of audio. Safe to call from the audio callback."""
+        mono = block.mean(axis=1) if block.ndim > 1 else block
+        if self.decimation > 1:
+            # Average groups of samples: a cheap low-pass + downsample, plenty for onset detection
+            usable = len(mono) - len(mono) % self.decimation
+            mono = mono[:usable].reshape(-1, self.decimation).mean(axis=1)
+
+        with self._lock:
+            size = len(self._audio)
+            start = self._written % size
+            first = min(len(mono), size - start)
+            self._audio[start:start + first] = mono[:first]
+            self._audio[:len(mono) - first] = mono[first:]
+            self._written += len(mono)
+            self._anchor_time = time.time()
+        self.new_audio.set()
+
+    def _copy_frame(self, start):
+        size = len(self._audio)
+        begin = start % size
+        first = min(self.n_fft, size - begin)
+        self._frame[:first] = self._audio[begin:begin + first]
+        self._frame[first:] = self._audio[:self.n_fft - first]
+
+    def process(self):
+        """Analyse every complete hop of new audio. Returns the number of envelope frames added."""
+        added = 0
+        while True:
+            with self._lock:
+                if self._written - self._next_frame < self.n_fft:
+                    break
+                if self._written - self._next_frame > len(self._audio):
+                    # Fell behind by more than the ring holds; skip ahead instead of reading overwritten audio
+                    self._next_frame = self._written - self.n_fft
+                self._copy_frame(self._next_frame)
+                self._next_frame += self.hop_length
+
+            spectrum = np.abs(np.fft.rfft(self._frame * self._window)) ** 2
+            mel_db = 10.0 * np.log10(np.maximum(1e-10, self._mel_basis @ spectrum))
+            mel_db = np.maximum(mel_db, mel_db.max() - self.top_db)
+            if self._previous_db is not None:
+                onset = np.maximum(0.0, mel_db - self._previous_db).mean()
+                self._envelope[self.frames_analysed % len(self._envelope)] = onset
+                self.frames_analysed += 1
+                added += 1
+            self._previous_db = mel_db
+        return added
+
+    def envelope(self):
+        """The cached onset envelope, oldest frame first (a reused buffer)."""
+        split = self.frames_analysed % len(self._envelope)
+        tail = len(self._envelope) - split
+        self._envelope_ordered[:tail] = self._envelope[split:]
+        self._envelope_ordered[tail:] = self._envelope[:split]
+        return self._envelope_ordered
+
+    def estimate(self):
+        """
+        Run tempo estimation over the cached envelope.
+        Returns (bpm, beat positions as indices into `envelope()`).
+        """
+        tempo, beats = librosa.beat.beat_track(onset_envelope=self.envelope(), sr=self.analysis_rate, hop_length=self.hop_length)
+        return float(np.atleast_1d(tempo)[0]), beats
+
+    def warm_up(self, bpm=120):
+        """
+        Run beat tracking once on a synthetic pulse envelope, so librosa's
+        numba functions are compiled (or loaded from the numba cache) before
+        the first real estimate instead of during it. The stream's state is
+        left untouched.
+        """
+        envelope = np.zeros(len(self._envelope), dtype=np.float32)
+        period = 60.0 / bpm * self.analysis_rate / self.hop_length
+        envelope[np.arange(0, len(envelope), period).astype(int)] = 1.0
+        librosa.beat.beat_track(onset_envelope=envelope, sr=self.analysis_rate, hop_length=self.hop_length)
+
+    def frame_times(self, indices):
+        """Wall-clock times of positions in `envelope()`."""
+        with self._lock:
+            written, anchor_time = self._written, self._anchor_time
+        # Envelope frame g compares STFT frames g and g + 1; the latter is centred on this sample
+        first_frame = self.frames_analysed - len(self._envelope)
+        samples = (first_frame + np.asarray(indices) + 1) * self.hop_length + self.n_fft // 2
+        return anchor_time - self.input_latency - (written - samples) / self.analysis_rate
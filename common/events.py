@@ -0,0 +1,108 @@
+import json
+import asyncio
+import threading
+
+
+class StateBroadcaster:
+    """
+    Holds the latest state of a detector and pushes every change to subscribers.
+
+    Services call `publish()` whenever they recompute their state; identical
+    states are dropped so subscribers only hear about real changes. Changes
+    can be consumed as a Server-Sent Events stream (`sse_stream()` for Flask,
+    `aiohttp_sse_stream()` for aiohttp) or through in-process callbacks
+    (`subscribe()`).
+    """
+
+    def __init__(self, initial_state=None):
+        self._condition = threading.Condition()
+        self._state = initial_state
+        self._version = 0 if initial_state is not None else -1
+        self._subscribers = []
+
+    @property
+    def state(self):
+        return self._state
+
+    def publish(self, state):
+        """Record a new state. Returns True if it differs from the previous one."""
+        with self._condition:
+            if state == self._state:
+                return False
+            self._state = state
+            self._version += 1
+            subscribers = list(self._subscribers)
+            self._condition.notify_all()
+
+        for callback in subscribers:
+            try:
+                callback(state)
+            except Exception as e:
+                print(f"Error notifying state subscriber: {e}")
+        return True
+
+    def subscribe(self, callback):
+        """Call `callback(state)` on every change until unsubscribed."""
+        with self._condition:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._condition:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def wait_for_change(self, version, timeout):
+        """
+        Block until the state is newer than `version` or `timeout` expires.
+        Returns (state, version, changed).
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version, timeout)
+            return self._state, self._version, self._version > version
+
+    def sse_stream(self, heartbeat=15):
+        """Yield the current state, then every change, formatted as SSE messages."""
+        version = -1
+        while True:
+            state, version, changed = self.wait_for_change(version, heartbeat)
+            if changed:
+                yield format_sse(state)
+            else:
+                # Comment line keeps proxies and the client's read timeout happy
+                yield ": keep-alive\n\n"
+
+
+async def aiohttp_sse_stream(request, broadcaster, heartbeat=15):
+    """
+    aiohttp response streaming the broadcaster's current state (if any), then
+    every change, as SSE messages until the client goes away.
+    """
+    from aiohttp import web  # Only the aiohttp services need it
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def on_change(state):
+        loop.call_soon_threadsafe(queue.put_nowait, state)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    broadcaster.subscribe(on_change)
+    try:
+        if broadcaster.state is not None:
+            await response.write(format_sse(broadcaster.state).encode())
+        while True:
+            try:
+                state = await asyncio.wait_for(queue.get(), heartbeat)
+                await response.write(format_sse(state).encode())
+            except asyncio.TimeoutError:
+                await response.write(b": keep-alive\n\n")
+    except ConnectionResetError:
+        # Client went away
+        pass
+    finally:
+        broadcaster.unsubscribe(on_change)
+    return response
+
+
+def format_sse(state):
+    return f"data: {json.dumps(state)}\n\n"
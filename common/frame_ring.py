@@ -0,0 +1,199 @@
+import hashlib
+import threading
+import time
+import cv2
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# int64 header: latest sequence number, slot count, height, width, channels, then spare fields
+HEADER_FIELDS = 8
+
+
+def segment_name(scene_name):
+    """Shared memory name for a scene (short and filesystem-safe on every OS)."""
+    return "autodir_" + hashlib.sha1(scene_name.encode()).hexdigest()[:16]
+
+
+class FrameRing:
+    """
+    Fixed-size ring of decoded frames for one scene, living in shared memory.
+
+    One writer (the frame capture service) fills the slots in turn and bumps
+    the latest sequence number once a frame is complete; any number of
+    reader processes map the same memory and get NumPy views of the newest
+    frame without copying it. A view stays valid until the writer wraps
+    around to its slot again, `slots - 1` frames later; readers that hold
+    on to a frame for longer can check `is_intact(seq)` or copy it.
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        slots, height, width, channels = (int(value) for value in self.header[1:5])
+        self.shape = (height, width, channels)
+        offset = HEADER_FIELDS * 8
+        self.slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.slot_time = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.frames = np.ndarray((slots, height, width, channels), dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def size_for(height, width, channels, slots):
+        return HEADER_FIELDS * 8 + slots * 16 + slots * height * width * channels
+
+    @classmethod
+    def create(cls, scene_name, height, width, channels=3, slots=4):
+        """Create (or take over) the ring for a scene. Only the capture service does this."""
+        name = segment_name(scene_name)
+        size = cls.size_for(height, width, channels, slots)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a previous run that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[1:5] = (slots, height, width, channels)
+        del header
+        ring = cls(shm, owner=True)
+        ring.slot_seq[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, scene_name):
+        """Map an existing ring. Raises FileNotFoundError if it doesn't exist yet."""
+        name = segment_name(scene_name)
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 always registers the segment with the resource tracker,
+            # which would unlink it when this reader exits
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm)
+
+    def write(self, frame, timestamp=None):
+        """Copy a BGR frame into the next slot (resizing it if needed) and publish it."""
+        seq = int(self.header[0]) + 1
+        slot = seq % len(self.slot_seq)
+        self.slot_seq[slot] = -1  # Mark the slot as being written
+        target = self.frames[slot]
+        if frame.shape == target.shape:
+            np.copyto(target, frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+        self.slot_time[slot] = timestamp or time.time()
+        self.slot_seq[slot] = seq
+        self.header[0] = seq
+        return seq
+
+    def latest(self):
+        """Return (frame view, seq, timestamp) of the newest frame, or (None, 0, 0.0) if there is none."""
+        for _ in range(3):
+            seq = int(self.header[0])
+            if seq <= 0:
+                break
+            slot = seq % len(self.slot_seq)
+            frame, timestamp = self.frames[slot], float(self.slot_time[slot])
+            if self.slot_seq[slot] == seq:
+                return frame, seq, timestamp
+            # The writer lapped us while we were reading; try again with the newer frame
+        return None, 0, 0.0
+
+    def latest_copy(self):
+        """Like latest(), but the frame is a private copy the writer can't overwrite."""
+        for _ in range(3):
+            frame, seq, timestamp = self.latest()
+            if frame is None:
+                break
+            frame = frame.copy()
+            if self.is_intact(seq):
+                return frame, seq, timestamp
+            # The slot was reused while copying; take the newer frame
+        return None, 0, 0.0
+
+    def is_intact(self, seq):
+        """True while the slot holding frame `seq` hasn't been overwritten."""
+        return self.slot_seq[seq % len(self.slot_seq)] == seq
+
+    def close(self):
+        # Views into the buffer must be dropped before the mapping can be closed
+        del self.header, self.slot_seq, self.slot_time, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class FrameRingReader:
+    """
+    Reads the newest frame of any scene published by the frame capture
+    service, attaching to rings lazily and re-attaching if the service has
+    been restarted (its old rings stop advancing). A ring that is still
+    stale after re-attaching (the service died without cleaning up) yields
+    no frame, and is only tried again `retry_interval` seconds later.
+    Safe to share between threads.
+    """
+
+    def __init__(self, stale_after=30.0, retry_interval=1.0):
+        self.stale_after = stale_after
+        self.retry_interval = retry_interval
+        self._rings = {}
+        self._retry_at = {}  # scene name -> earliest time to try attaching again
+        self._lock = threading.Lock()
+
+    def latest_frame(self, scene_name, copy=False):
+        """Newest frame of a scene, or None if none is available yet; see `latest()`."""
+        return self.latest(scene_name, copy)[0]
+
+    def latest(self, scene_name, copy=False):
+        """
+        (frame, seq) of the newest frame of a scene, or (None, 0) if none is
+        available yet. The sequence number only advances with new frames.
+
+        The frame is a view into shared memory, valid until the writer reuses
+        its slot a few captures later: fine for an immediate resize or
+        comparison. Callers that hold on to it (batches, worker pools) pass
+        `copy=True` to get a private copy instead.
+        """
+        now = time.time()
+        with self._lock:
+            ring = self._rings.get(scene_name)
+            if ring is not None:
+                frame, seq, timestamp = ring.latest_copy() if copy else ring.latest()
+                if frame is not None and now - timestamp < self.stale_after:
+                    return frame, seq
+                del frame
+                self._detach(scene_name)
+
+            if now < self._retry_at.get(scene_name, 0.0):
+                return None, 0
+            try:
+                ring = FrameRing.attach(scene_name)
+            except FileNotFoundError:
+                return None, 0
+            frame, seq, timestamp = ring.latest_copy() if copy else ring.latest()
+            if frame is None or now - timestamp >= self.stale_after:
+                # Nothing fresh published yet; don't map the segment again on every call
+                self._retry_at[scene_name] = now + self.retry_interval
+                del frame
+                self._close(ring)
+                return None, 0
+            self._retry_at.pop(scene_name, None)
+            self._rings[scene_name] = ring
+            return frame, seq
+
+    def _detach(self, scene_name):
+        self._close(self._rings.pop(scene_name))
+
+    @staticmethod
+    def _close(ring):
+        try:
+            ring.close()
+        except BufferError:
+            # A caller still holds a view into the old mapping; let it be collected later
+            pass
@@ -0,0 +1,47 @@
+import base64
+import cv2
+import numpy as np
+from common.metrics import histogram
+
+# What every consumer used to request; profiles in config.json override it per consumer
+DEFAULT_PROFILE = {"width": 1280, "height": 720, "format": "jpg", "quality": 100}
+
+SCREENSHOT_SECONDS = histogram("obs_screenshot_seconds", "GetSourceScreenshot round trip to OBS")
+DECODE_SECONDS = histogram("frame_decode_seconds", "Decoding a base64 screenshot into a NumPy array")
+
+
+def capture_profile(config, consumer, **defaults):
+    """
+    Screenshot settings for one consumer: the built-in defaults, overridden by
+    the consumer's defaults, overridden by config["capture"][consumer].
+    """
+    return {**DEFAULT_PROFILE, **defaults, **config.get("capture", {}).get(consumer, {})}
+
+
+def take_screenshot(cl, scene_name, profile):
+    """Fetch a screenshot of a scene from OBS as a base64 data URI."""
+    with SCREENSHOT_SECONDS.time(scene=scene_name):
+        response = cl.get_source_screenshot(
+            name=scene_name,
+            img_format=profile["format"],
+            width=profile["width"],
+            height=profile["height"],
+            quality=profile["quality"],
+        )
+    return response.image_data
+
+
+def decode_frame(image_data, grayscale=False):
+    """
+    Decode an OBS screenshot (base64 data URI or bare base64) straight into a
+    NumPy array: BGR uint8 (what OpenCV and ultralytics expect) or 8-bit
+    grayscale. The decoded bytes are wrapped without copying and handed to
+    OpenCV's decoder, so there is no PIL image and no color conversion pass.
+    """
+    _, _, payload = image_data.rpartition(",")
+    with DECODE_SECONDS.time():
+        encoded = np.frombuffer(base64.b64decode(payload), dtype=np.uint8)
+        frame = cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode screenshot")
+    return frame
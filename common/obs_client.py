@@ -0,0 +1,24 @@
+import threading
+
+
+class SharedReqClient:
+    """
+    An obsws_python ReqClient that several threads can use at once, so one
+    OBS connection can serve every detector (see the all-in-one runtime). Each request is a send followed by a blocking
+    receive on the same socket, so requests are serialised with a lock to
+    keep every response with its caller.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return locked
@@ -0,0 +1,58 @@
+import threading
+import time
+from common.metrics import gauge
+
+READY = gauge("service_ready", "1 once the service is warmed up and its signal can be trusted")
+STARTUP_SECONDS = gauge("startup_seconds", "Seconds from launch until the service was ready")
+
+
+class Readiness:
+    """
+    Startup progress of a service, served on its /ready endpoint.
+
+    The service moves through named stages (loading the model, warming up,
+    waiting for the first frames, ...) and calls `set_ready()` once its first
+    trustworthy result is published. Until then /ready answers 503, so the
+    director knows not to act on the service's default values.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.started = time.time()
+        self.stage = "starting"
+        self.ready = False
+        self.ready_seconds = None
+        self._lock = threading.Lock()
+        self._callbacks = []
+        READY.set(0, service=service)
+
+    def set_stage(self, stage):
+        self.stage = stage
+        print(f"{self.service}: {stage} ({time.time() - self.started:.1f}s)")
+
+    def set_ready(self):
+        """Mark the service ready; only the first call has an effect."""
+        with self._lock:
+            if self.ready:
+                return
+            self.ready = True
+            self.stage = "ready"
+            self.ready_seconds = time.time() - self.started
+            callbacks = list(self._callbacks)
+        READY.set(1, service=self.service)
+        STARTUP_SECONDS.set(round(self.ready_seconds, 3), service=self.service)
+        print(f"{self.service}: ready after {self.ready_seconds:.1f}s")
+        for callback in callbacks:
+            callback()
+
+    def on_ready(self, callback):
+        """Call `callback()` once the service is ready (right away if it already is)."""
+        with self._lock:
+            if not self.ready:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def status(self):
+        elapsed = self.ready_seconds if self.ready else time.time() - self.started
+        return {"service": self.service, "ready": self.ready, "stage": self.stage, "seconds": round(elapsed, 2)}
@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import obsws_python as obs
+from flask import Flask, Response, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics
+from common.readiness import Readiness
+from common.frames import capture_profile, take_screenshot, decode_frame
+from common.frame_ring import FrameRing, segment_name
+
+config = None
+with open("../config.json", "r") as file:
+    config = json.load(file)
+
+CAPTURE_CONFIG = config.get("frame_capture", {})
+PROJECTOR_SCENE = config["obs"]["scenes"]["projector_scene"]
+# Every scene any detector looks at: the camera scenes plus the projector
+SCENES = CAPTURE_CONFIG.get("scenes", list(dict.fromkeys(config["obs"]["scenes"]["list"] + [PROJECTOR_SCENE])))
+# One profile for every consumer, so each frame is only rendered and encoded once
+CAPTURE_PROFILE = capture_profile(config, "frame_capture", width=640, height=360, quality=90)
+
+DEFAULT_INTERVAL = CAPTURE_CONFIG.get("interval", 1.0)
+PROGRAM_INTERVAL = CAPTURE_CONFIG.get("program_interval", 0.5)
+SCENE_INTERVALS = CAPTURE_CONFIG.get("intervals", {PROJECTOR_SCENE: 0.25})
+
+# Flask app setup
+app = Flask(__name__)
+
+# Connect to OBS WebSocket; this is the only process that takes screenshots
+cl = obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+
+current_scene_name = cl.get_current_program_scene().current_program_scene_name
+
+# Shared memory ring per scene that the detector processes read from
+rings = {
+    scene_name: FrameRing.create(scene_name, CAPTURE_PROFILE["height"], CAPTURE_PROFILE["width"], slots=CAPTURE_CONFIG.get("slots", 4))
+    for scene_name in SCENES
+}
+capture_stats = {scene_name: {"frames": 0, "errors": 0} for scene_name in SCENES}
+# Ready once every ring holds a frame, so readers never start on empty rings
+readiness = Readiness("frame_capture")
+
+def close_rings():
+    for ring in rings.values():
+        ring.close()
+
+atexit.register(close_rings)
+
+# Capture the program scene more often, since the director's cuts depend on it
+def on_current_program_scene_changed(data):
+    global current_scene_name
+    current_scene_name = data.scene_name
+
+def scene_interval(scene_name):
+    interval = SCENE_INTERVALS.get(scene_name, DEFAULT_INTERVAL)
+    if scene_name == current_scene_name:
+        interval = min(interval, PROGRAM_INTERVAL)
+    return interval
+
+# Screenshot every scene on its own schedule and publish the decoded frames
+def capture_loop():
+    next_due = {scene_name: 0.0 for scene_name in SCENES}
+    while True:
+        now = time.time()
+        earliest_due = min(next_due.values())
+        if earliest_due:
+            metrics.record_loop_lag("capture", earliest_due, now)
+        for scene_name in sorted(next_due, key=next_due.get):
+            if next_due[scene_name] > now:
+                break
+            try:
+                frame = decode_frame(take_screenshot(cl, scene_name, CAPTURE_PROFILE))
+                rings[scene_name].write(frame)
+                capture_stats[scene_name]["frames"] += 1
+                if not readiness.ready and all(stats["frames"] for stats in capture_stats.values()):
+                    readiness.set_ready()
+            except Exception as e:
+                capture_stats[scene_name]["errors"] += 1
+                print(f"Error capturing {scene_name}: {e}")
+            # Don't try to catch up on missed captures, just stay on schedule from here
+            next_due[scene_name] = max(next_due[scene_name] + scene_interval(scene_name), time.time())
+
+        time.sleep(max(0.0, min(next_due.values()) - time.time()))
+
+@app.route('/status', methods=['GET'])
+def get_status():
+    now = time.time()
+    status = {}
+    for scene_name, ring in rings.items():
+        _, seq, timestamp = ring.latest()
+        status[scene_name] = {
+            "segment": segment_name(scene_name),
+            "seq": seq,
+            "age": round(now - timestamp, 3) if seq else None,
+            "interval": scene_interval(scene_name),
+            **capture_stats[scene_name],
+        }
+    return jsonify({"profile": CAPTURE_PROFILE, "scenes": status})
+
+# 200 once every scene has been captured at least once, 503 before
+@app.route('/ready', methods=['GET'])
+def get_ready():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+# Prometheus metrics of this service's hot paths
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+if __name__ == "__main__":
+    events = obs.EventClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+    events.callback.register(on_current_program_scene_changed)
+
+    flask_thread = threading.Thread(target=app.run, kwargs={"host": "0.0.0.0", "port": 5290, "debug": False})
+    flask_thread.daemon = True
+    flask_thread.start()
+
+    capture_loop()
@@ -0,0 +1,91 @@
+"""
+Benchmark the person detector backends against the ultralytics/PyTorch baseline.
+
+Runs every sample frame in a folder through each backend and reports the
+latency per frame and how often each backend agrees with the baseline on
+"this frame has a person in it". A backend is only safe to roll out if it
+agrees on every frame.
+
+Usage (from the interesting_scene folder):
+    python benchmark_detector.py --frames samples/ --backends ultralytics onnx onnx-int8
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from interesting_scene.detectors import create_detector, list_images
+
+
+def run_backend(detector, images, batch_size, warmup):
+    # The first calls pay one-off allocation/optimisation costs, keep them out of the numbers
+    for _ in range(warmup):
+        detector.person_scores(images[:batch_size])
+
+    scores = []
+    latencies = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        began = time.perf_counter()
+        scores.extend(detector.person_scores(batch))
+        latencies.extend([(time.perf_counter() - began) / len(batch) * 1000] * len(batch))
+    return scores, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", required=True, help="Folder of sample frames (jpg/png)")
+    parser.add_argument("--backends", nargs="+", default=["ultralytics", "onnx", "onnx-int8"])
+    parser.add_argument("--config", default="../config.json", help="config.json to read detector settings from")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--confidence", type=float, default=0.55)
+    args = parser.parse_args()
+
+    detector_config = {}
+    if os.path.exists(args.config):
+        with open(args.config, "r") as file:
+            detector_config = json.load(file).get("interesting_scene", {}).get("detector", {})
+
+    paths = list_images(args.frames)
+    if not paths:
+        sys.exit(f"No images found in {args.frames}")
+    images = [cv2.imread(path) for path in paths]
+    print(f"Benchmarking {len(images)} frames, batch size {args.batch_size}\n")
+
+    backends = ["ultralytics"] + [backend for backend in args.backends if backend != "ultralytics"]
+    baseline = None
+    baseline_latency = None
+    all_agree = True
+
+    print(f"{'backend':<14}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'speedup':>9}{'agreement':>11}")
+    for backend in backends:
+        detector = create_detector({**detector_config, "backend": backend}, confidence=args.confidence)
+        scores, latencies = run_backend(detector, images, args.batch_size, args.warmup)
+        decisions = [score > args.confidence for score in scores]
+
+        if baseline is None:
+            baseline = decisions
+            baseline_latency = latencies.mean()
+        disagreements = [path for path, a, b in zip(paths, decisions, baseline) if a != b]
+        agreement = 1 - len(disagreements) / len(paths)
+        all_agree = all_agree and not disagreements
+
+        print(f"{backend:<14}{latencies.mean():>9.1f}{np.percentile(latencies, 50):>9.1f}"
+              f"{np.percentile(latencies, 95):>9.1f}{baseline_latency / latencies.mean():>8.2f}x{agreement:>10.1%}")
+        for path in disagreements:
+            print(f"    disagrees with ultralytics on {os.path.basename(path)}")
+
+    if all_agree:
+        print("\nAll backends agree with the ultralytics baseline on every frame.")
+    else:
+        print("\nSome backends change which frames count as having people; don't roll them out.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import cv2
+import numpy as np
+
+PERSON_CLASS = 0  # Class 0 corresponds to 'person' in the COCO classes YOLO is trained on
+
+
+class UltralyticsDetector:
+    """Person detector running the stock ultralytics/PyTorch YOLO model."""
+
+    name = "ultralytics"
+
+    def __init__(self, model_path="yolo11n.pt", confidence=0.55, imgsz=640):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.confidence = confidence
+        self.imgsz = imgsz
+
+    def person_scores(self, images):
+        """Return the highest person confidence found in each image (0.0 if none)."""
+        results = self.model(images, imgsz=self.imgsz, verbose=False)
+        scores = []
+        for result in results:
+            boxes = result.boxes
+            person_conf = boxes.conf[boxes.cls == PERSON_CLASS]
+            scores.append(float(person_conf.max()) if len(person_conf) else 0.0)
+        return scores
+
+    def has_person(self, images):
+        return [score > self.confidence for score in self.person_scores(images)]
+
+    def person_boxes(self, images):
+        """Return the people found in each image as [x1, y1, x2, y2, confidence] in pixels."""
+        results = self.model(images, imgsz=self.imgsz, verbose=False)
+        people = []
+        for result in results:
+            boxes = result.boxes
+            keep = (boxes.cls == PERSON_CLASS) & (boxes.conf > self.confidence)
+            people.append([[*map(float, box), float(conf)] for box, conf in zip(boxes.xyxy[keep].tolist(), boxes.conf[keep].tolist())])
+        return people
+
+
+class OnnxDetector:
+    """
+    Person detector running an exported YOLO model on ONNX Runtime (CPU).
+
+    Only "is there a person above the confidence threshold" matters to the
+    director, so `has_person` reduces the raw class scores directly and
+    does no box decoding or NMS. Only `person_boxes` (for tracking) does.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path, confidence=0.55, imgsz=640, threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        # Graph optimization takes a while on every start, so the optimized graph is
+        # saved next to the model and loaded as is until the model changes
+        optimized_path = os.path.splitext(model_path)[0] + ".optimized.onnx"
+        if os.path.exists(optimized_path) and os.path.getmtime(optimized_path) >= os.path.getmtime(model_path):
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            model_path = optimized_path
+        else:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.optimized_model_filepath = optimized_path
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # Models exported without dynamic=True only take one image at a time
+        self.fixed_batch = isinstance(self.session.get_inputs()[0].shape[0], int)
+        self.confidence = confidence
+        self.imgsz = imgsz
+
+    def _run(self, images):
+        batch = np.stack([letterbox(img, self.imgsz) for img in images])
+        if self.fixed_batch:
+            return np.concatenate([self.session.run(None, {self.input_name: item[None]})[0] for item in batch])
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def person_scores(self, images):
+        # Output is (batch, 4 box coords + 80 class scores, anchors)
+        outputs = self._run(images)
+        return [float(score) for score in outputs[:, 4 + PERSON_CLASS, :].max(axis=1)]
+
+    def has_person(self, images):
+        return [score > self.confidence for score in self.person_scores(images)]
+
+    def person_boxes(self, images, iou_threshold=0.45):
+        """Return the people found in each image as [x1, y1, x2, y2, confidence] in pixels."""
+        people = []
+        for img, output in zip(images, self._run(images)):
+            scores = output[4 + PERSON_CLASS]
+            keep = np.flatnonzero(scores > self.confidence)
+            # Boxes are centre x/y, width, height in the letterboxed image
+            cx, cy, w, h = output[:4, keep]
+            rects = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+            picked = cv2.dnn.NMSBoxes(rects.tolist(), scores[keep].tolist(), self.confidence, iou_threshold) if len(keep) else []
+            scale, left, top = letterbox_geometry(img, self.imgsz)
+            boxes = []
+            for index in np.asarray(picked, dtype=int).reshape(-1):
+                x, y, box_width, box_height = rects[index]
+                x1, y1 = (x - left) / scale, (y - top) / scale
+                boxes.append([float(x1), float(y1), float(x1 + box_width / scale), float(y1 + box_height / scale), float(scores[keep][index])])
+            people.append(boxes)
+        return people
+
+
+def letterbox_geometry(img, imgsz):
+    """Scale and (left, top) padding that letterbox() applies to a frame."""
+    height, width = img.shape[:2]
+    scale = imgsz / max(width, height)
+    new_width, new_height = round(width * scale), round(height * scale)
+    return scale, (imgsz - new_width) // 2, (imgsz - new_height) // 2
+
+
+def letterbox(img, imgsz):
+    """Letterbox a BGR frame into a normalised RGB CHW float32 array, like ultralytics does."""
+    height, width = img.shape[:2]
+    scale, left, top = letterbox_geometry(img, imgsz)
+    new_width, new_height = round(width * scale), round(height * scale)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_height, left:left + new_width] = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    # BGR -> RGB and HWC -> CHW are views; the float conversion is the only copy
+    return canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+
+
+def warm_up(detector, width=640, height=360, batch_sizes=(1,), boxes=False):
+    """
+    Run the detector on blank frames, so one-off costs (lazy initialisation,
+    memory allocation, kernel selection) are paid before the first real frame.
+    """
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    for batch_size in batch_sizes:
+        if boxes:
+            detector.person_boxes([frame] * batch_size)
+        else:
+            detector.has_person([frame] * batch_size)
+
+
+def export_onnx(model_path, imgsz=640):
+    """Export a YOLO .pt model to ONNX with a dynamic batch size. Returns the .onnx path."""
+    from ultralytics import YOLO
+    return YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def quantize_int8(onnx_path, int8_path, calibration_dir=None, imgsz=640):
+    """
+    Quantize an ONNX model to int8. With a folder of sample frames the
+    activations are calibrated (static quantization, best for the conv
+    layers YOLO is made of); without one only the weights are quantized.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic, quantize_static, CalibrationDataReader
+
+    if not calibration_dir:
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return int8_path
+
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter([
+                {input_name: letterbox(cv2.imread(path), imgsz)[None]}
+                for path in list_images(calibration_dir)
+            ])
+
+        def get_next(self):
+            return next(self.frames, None)
+
+    quantize_static(onnx_path, int8_path, FrameReader(), activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def list_images(folder):
+    extensions = (".jpg", ".jpeg", ".png", ".bmp")
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(extensions))
+
+
+def create_detector(detector_config, confidence=0.55):
+    """
+    Build the person detector selected in config.json. Exported/quantized
+    models are created next to the .pt model the first time they're needed.
+    """
+    backend = detector_config.get("backend", "ultralytics")
+    model_path = detector_config.get("model", "yolo11n.pt")
+    imgsz = detector_config.get("imgsz", 640)
+    threads = detector_config.get("threads")
+
+    if backend == "ultralytics":
+        return UltralyticsDetector(model_path, confidence, imgsz)
+
+    onnx_path = detector_config.get("onnx_model", os.path.splitext(model_path)[0] + ".onnx")
+    if not os.path.exists(onnx_path):
+        print(f"Exporting {model_path} to {onnx_path}")
+        os.replace(export_onnx(model_path, imgsz), onnx_path)
+    if backend == "onnx":
+        return OnnxDetector(onnx_path, confidence, imgsz, threads)
+
+    if backend == "onnx-int8":
+        int8_path = detector_config.get("int8_model", os.path.splitext(onnx_path)[0] + "-int8.onnx")
+        if not os.path.exists(int8_path):
+            print(f"Quantizing {onnx_path} to {int8_path}")
+            quantize_int8(onnx_path, int8_path, detector_config.get("calibration_dir"), imgsz)
+        detector = OnnxDetector(int8_path, confidence, imgsz, threads)
+        detector.name = "onnx-int8"
+        return detector
+
+    raise ValueError(f"Unknown detector backend: {backend}")
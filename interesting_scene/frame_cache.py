@@ -0,0 +1,55 @@
+import time
+import cv2
+import numpy as np
+
+
+class DetectionCache:
+    """
+    Remembers the last person/no-person result for each scene together with a
+    tiny grayscale fingerprint of the frame it was computed from.
+
+    A new screenshot whose fingerprint is within `change_threshold` (mean
+    absolute difference, 0-255 scale) of the cached one reuses the cached
+    result instead of running the model, as long as the result is younger
+    than `max_age` seconds.
+    """
+
+    def __init__(self, change_threshold=3.0, max_age=30, fingerprint_size=(32, 18)):
+        self.change_threshold = change_threshold
+        self.max_age = max_age
+        self.fingerprint_size = tuple(fingerprint_size)
+        self._entries = {}  # scene name -> (fingerprint, has_person, analysed_time)
+
+        self.hits = 0
+        self.misses = 0
+        self.inference_calls = 0
+
+    def fingerprint(self, img):
+        """Tiny grayscale thumbnail of a BGR frame."""
+        small = cv2.resize(img, self.fingerprint_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+    def lookup(self, scene_name, fingerprint, now=None):
+        """Return the cached result for an unchanged frame, or None if the model has to run."""
+        entry = self._entries.get(scene_name)
+        if entry is not None:
+            cached_fingerprint, has_person, analysed_time = entry
+            fresh = (now or time.time()) - analysed_time < self.max_age
+            if fresh and np.abs(fingerprint - cached_fingerprint).mean() <= self.change_threshold:
+                self.hits += 1
+                return has_person
+        self.misses += 1
+        return None
+
+    def store(self, scene_name, fingerprint, has_person, now=None):
+        self._entries[scene_name] = (fingerprint, has_person, now or time.time())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "skipped_inferences": self.hits,
+            "inference_calls": self.inference_calls,
+        }
@@ -0,0 +1,32 @@
+import threading
+
+
+class SceneState:
+    """
+    The latest person/no-person result of every scene, shared between the
+    thread that merges detection results and the Flask handlers.
+
+    Results from one sweep are merged under a lock, and `status()` copies
+    them under the same lock, so a reader never sees a half-merged sweep or
+    a list that is being mutated.
+    """
+
+    def __init__(self, scenes):
+        self.scenes = list(scenes)
+        self._lock = threading.Lock()
+        self._has_person = {}
+        self._person_in_program = False
+
+    def merge(self, has_person, program_scene=None):
+        """Record {scene name: has person}; `program_scene`'s result also becomes person_in_current_scene."""
+        with self._lock:
+            self._has_person.update(has_person)
+            if program_scene in has_person:
+                self._person_in_program = has_person[program_scene]
+
+    def status(self):
+        with self._lock:
+            return {
+                "person_in_current_scene": self._person_in_program,
+                "scenes_with_people": [scene for scene in self.scenes if self._has_person.get(scene)],
+            }
@@ -0,0 +1,128 @@
+import threading
+import time
+
+
+class ScanScheduler:
+    """
+    Decides which scenes to screenshot and run through the detector next.
+
+    Every scene gets a rescan interval from its importance and history:
+    the program scene and the current preview scene are refreshed the most
+    often, scenes whose result changed recently come next, and the rest
+    back off towards `max_interval` the more stable their result has been.
+    Scans are paid for from a token bucket refilled at `budget` scans per
+    second, so the total OBS/CPU load stays bounded however many scenes are
+    configured. When there are more due scenes than tokens, the most
+    overdue ones go first.
+
+    The scan thread and on-demand checks (request threads) share one
+    scheduler, so its state is only touched under a lock.
+    """
+
+    def __init__(self, scenes, budget=4.0, program_interval=1.0, preview_interval=1.5,
+                 recent_interval=3.0, max_interval=10.0, recent_change_window=15.0,
+                 volatility_decay=0.3):
+        if not isinstance(budget, (int, float)) or budget <= 0:
+            raise ValueError(f"interesting_scene.scan_budget must be a positive number of scans per second, got {budget!r}")
+        self.budget = budget
+        self.program_interval = program_interval
+        self.preview_interval = preview_interval
+        self.recent_interval = recent_interval
+        self.max_interval = max_interval
+        self.recent_change_window = recent_change_window
+        self.volatility_decay = volatility_decay
+
+        self._lock = threading.Lock()
+        self._burst = max(1.0, budget)
+        self._tokens = self._burst
+        self._last_refill = time.time()
+        self._scenes = {}
+        for scene_name in scenes:
+            self._add(scene_name)
+
+        self.scans = 0
+
+    def _add(self, scene_name):
+        self._scenes[scene_name] = {
+            "last_scan": 0.0,
+            "last_change": 0.0,
+            "result": None,
+            "volatility": 0.0,
+        }
+
+    def result(self, scene_name):
+        with self._lock:
+            state = self._scenes.get(scene_name)
+            return state["result"] if state else None
+
+    def interval(self, scene_name, now, program_scene=None, preview_scene=None):
+        """How long a scene's result may age before it is rescanned."""
+        if scene_name == program_scene:
+            return self.program_interval
+        if scene_name == preview_scene:
+            return self.preview_interval
+
+        state = self._scenes[scene_name]
+        # Volatile scenes (result flips a lot) approach the recent-change interval
+        interval = self.max_interval - (self.max_interval - self.recent_interval) * state["volatility"]
+        if now - state["last_change"] < self.recent_change_window:
+            interval = min(interval, self.recent_interval)
+        return interval
+
+    def _refill(self, now):
+        self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self.budget)
+        self._last_refill = now
+
+    def next_batch(self, now, program_scene=None, preview_scene=None):
+        """Return the scenes to scan now, most overdue first, within the budget."""
+        with self._lock:
+            for scene_name in (program_scene, preview_scene):
+                if scene_name and scene_name not in self._scenes:
+                    self._add(scene_name)
+
+            self._refill(now)
+            overdue = []
+            for scene_name, state in self._scenes.items():
+                interval = self.interval(scene_name, now, program_scene, preview_scene)
+                ratio = (now - state["last_scan"]) / interval
+                if ratio >= 1:
+                    overdue.append((ratio, scene_name))
+            overdue.sort(reverse=True)
+
+            batch = [scene_name for _, scene_name in overdue[:int(self._tokens)]]
+            self._tokens -= len(batch)
+            return batch
+
+    def record(self, scene_name, result, now):
+        with self._lock:
+            state = self._scenes[scene_name]
+            changed = state["result"] is not None and result != state["result"]
+            if changed:
+                state["last_change"] = now
+            state["volatility"] += self.volatility_decay * (changed - state["volatility"])
+            state["result"] = result
+            state["last_scan"] = now
+            self.scans += 1
+
+    def time_until_next(self, now, program_scene=None, preview_scene=None):
+        """Seconds until the next scene becomes due and a token is available for it."""
+        with self._lock:
+            self._refill(now)
+            due_in = min(
+                (state["last_scan"] + self.interval(scene_name, now, program_scene, preview_scene) - now
+                 for scene_name, state in self._scenes.items()),
+                default=self.max_interval,
+            )
+            token_in = (1 - self._tokens) / self.budget if self._tokens < 1 else 0.0
+            return max(due_in, token_in, 0.0)
+
+    def stats(self, now, program_scene=None, preview_scene=None):
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "scans": self.scans,
+                "intervals": {
+                    scene_name: round(self.interval(scene_name, now, program_scene, preview_scene), 2)
+                    for scene_name in self._scenes
+                },
+            }
@@ -1,120 +1,405 @@
 import os
+import sys
 import json
-from ultralytics import YOLO
 import time
-import base64
 import obsws_python as obs
-from PIL import Image
-from io import BytesIO
 import threading
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics
+from common.events import StateBroadcaster
+from common.readiness import Readiness
+from common.frames import capture_profile, take_screenshot, decode_frame
+from common.frame_ring import FrameRingReader
+from common.obs_client import SharedReqClient
+from interesting_scene.frame_cache import DetectionCache
+from interesting_scene.scheduler import ScanScheduler
+from interesting_scene.detectors import create_detector, warm_up
+from interesting_scene.scene_state import SceneState
+from interesting_scene.worker_pool import DetectorPool
+from interesting_scene.tracker import PersonTracker
 
 config = None
 with open("../config.json", "r") as file:
     config = json.load(file)
 
 SCENE_LIST = config["obs"]["scenes"]["list"]
+SCENE_CONFIG = config.get("interesting_scene", {})
+# "adaptive" rescans scenes by importance within a budget, "batch" sweeps every scene
+# in one inference call, "sequential" checks one scene at a time
+SWEEP_MODE = SCENE_CONFIG.get("sweep_mode", "adaptive")
+PERSON_CONFIDENCE = 0.55
+# YOLO letterboxes to 640 px anyway, so there's no point fetching 720p
+CAPTURE_PROFILE = capture_profile(config, "interesting_scene", width=640, height=360, quality=85)
+# Read frames published by the frame_capture service instead of taking our own screenshots
+frame_reader = FrameRingReader() if config.get("frame_capture", {}).get("enabled") else None
 
-model = YOLO("yolo11n.pt")
+# Person detector backend (ultralytics, onnx or onnx-int8) selected in config.json; loaded by start()
+detector = None
+# With "workers" set, frames are detected on a pool of processes instead, one model per process
+WORKERS = SCENE_CONFIG.get("workers", 0)
+detector_pool = None
 
 # Folder where snapshots will be saved
 # snapshot_folder = "snapshots"
 # if not os.path.exists(snapshot_folder):
 #     os.makedirs(snapshot_folder)
 
-# Connect to OBS WebSocket
-cl = obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+# OBS WebSocket clients, connected by start() (or shared by the all-in-one runtime)
+cl = None
+event_client = None
 
 # Global variables
-person_in_current_scene = False
-scenes_with_people = []
+scene_state = SceneState(SCENE_LIST)
+current_scene_name = None
+current_preview_scene_name = None
+
+# Set when the program or preview scene changes so the adaptive scheduler rescans right away
+scan_wakeup = threading.Event()
+
+# Held while the detection cache, tracker or model are in use, so an on-demand /check
+# only ever waits for the inference call in progress, not for a whole sweep
+detection_lock = threading.Lock()
+
+# Decides which scenes to rescan next in "adaptive" mode
+scan_scheduler = ScanScheduler(
+    SCENE_LIST,
+    budget=SCENE_CONFIG.get("scan_budget", 4.0),
+    program_interval=SCENE_CONFIG.get("program_interval", 1.0),
+    preview_interval=SCENE_CONFIG.get("preview_interval", 1.5),
+    recent_interval=SCENE_CONFIG.get("recent_interval", 3.0),
+    max_interval=SCENE_CONFIG.get("max_interval", 10.0),
+)
+
+# Skips the model for scenes whose frame hasn't changed since they were last analysed
+detection_cache = DetectionCache(
+    change_threshold=SCENE_CONFIG.get("change_threshold", 3.0),
+    max_age=SCENE_CONFIG.get("cache_max_age", 30),
+)
+
+# Between keyframes, follows the people found by the detector instead of running the model again
+TRACKING_CONFIG = SCENE_CONFIG.get("tracking", {})
+person_tracker = None
+if TRACKING_CONFIG.get("enabled"):
+    person_tracker = PersonTracker(
+        keyframe_interval=TRACKING_CONFIG.get("keyframe_interval", 5.0),
+        min_score=TRACKING_CONFIG.get("min_score", 0.6),
+        search_margin=TRACKING_CONFIG.get("search_margin", 0.5),
+    )
+
+# Pushes status changes to subscribers of /events
+status_broadcaster = StateBroadcaster()
+# Ready once the model is warmed up and a first set of results is published
+readiness = Readiness("interesting_scene")
+
+INFERENCE_SECONDS = metrics.histogram("detector_inference_seconds", "One batched person detector call")
+DETECTOR_IMAGES = metrics.counter("detector_images_total", "Frames run through the person detector")
+CACHE_HITS = metrics.counter("detection_cache_hits_total", "Frames answered from the detection cache without inference")
+TRACKED_FRAMES = metrics.counter("tracked_frames_total", "Frames answered by following a person from the last keyframe without inference")
+CHECK_SECONDS = metrics.histogram("priority_check_seconds", "One on-demand /check of a scene, from request to result")
 
 # Flask app setup
 app = Flask(__name__)
 
-# Function to decode and save Base64 image
-def image_has_person_in_scene(base64_data):
-    img_data = base64.b64decode(base64_data)
-    img = Image.open(BytesIO(img_data))
-    
-    results = model(img)
-    
-    # Save the image with detections
-    # results[0].save(filename)
-    
-    # Check if any person is detected with confidence above 0.50
-    for result in results[0].boxes:
-        if result.cls == 0 and result.conf > 0.55:  # Class 0 corresponds to 'person' in YOLO
-            return True
-    return False
+# Run a batch of images through the model in a single inference call
+def images_have_person(images):
+    # Check if any person is detected with confidence above PERSON_CONFIDENCE
+    DETECTOR_IMAGES.inc(len(images))
+    with INFERENCE_SECONDS.time(batch=len(images)):
+        if person_tracker is not None:
+            # The people's boxes, so they can be tracked until the next keyframe
+            return detector.person_boxes(images)
+        return detector.has_person(images)
+
+# Cache a detector result and start tracking the people in it; returns whether there is a person
+def record_detection(scene_name, img, fingerprint, result):
+    if person_tracker is not None:
+        person_tracker.keyframe(scene_name, img, result)
+        result = len(result) > 0
+    detection_cache.store(scene_name, fingerprint, result)
+    return result
+
+# Detect people in (scene name, image) pairs, only running the model on frames that changed.
+# Pass a generator to overlap capture with inference: with a worker pool, each changed
+# frame is handed to the pool as soon as it's captured. `priority` frames go to the pool's
+# check worker, ahead of the frames the scan thread has queued.
+def detect_people(scene_images, priority=False):
+    has_person = {}
+    changed = {}
+    submitted = {}
+    for scene_name, img in scene_images:
+        if img is None:
+            # No frame available for this scene yet
+            continue
+        fingerprint = detection_cache.fingerprint(img)
+        with detection_lock:
+            cached = detection_cache.lookup(scene_name, fingerprint)
+            if cached is None and person_tracker is not None and person_tracker.check(scene_name, img):
+                # Still following a person found at the last keyframe
+                has_person[scene_name] = True
+                TRACKED_FRAMES.inc()
+                continue
+            if cached is not None:
+                has_person[scene_name] = cached
+                CACHE_HITS.inc()
+                continue
+            if detector_pool is None:
+                changed[scene_name] = (img, fingerprint)
+                continue
+        # Outside the lock: submit() blocks while the pool's queue is full
+        DETECTOR_IMAGES.inc()
+        submitted[scene_name] = (detector_pool.submit(img, priority=priority), fingerprint, img)
+
+    if submitted:
+        with detection_lock:
+            detection_cache.inference_calls += 1
+    for scene_name, (result, fingerprint, img) in submitted.items():
+        try:
+            result = result.get()
+        except Exception as e:
+            # A bad frame or a runtime error in the worker; the scene keeps its last result
+            print(f"Error detecting people in {scene_name}: {e}")
+            continue
+        with detection_lock:
+            has_person[scene_name] = record_detection(scene_name, img, fingerprint, result)
+
+    if changed:
+        with detection_lock:
+            detection_cache.inference_calls += 1
+            results = images_have_person([img for img, _ in changed.values()])
+            for (scene_name, (img, fingerprint)), result in zip(changed.items(), results):
+                has_person[scene_name] = record_detection(scene_name, img, fingerprint, result)
+    return has_person
+
+# True/False, or None if there is no frame of the scene to check yet
+def image_has_person_in_scene(img, scene_name, priority=False):
+    return detect_people([(scene_name, img)], priority).get(scene_name)
+
+# Get the latest frame of a scene as a BGR array (None if the frame capture service has none yet)
+def capture_scene(scene_name):
+    if frame_reader is not None:
+        # A copy: frames are held across batches and pool calls, longer than a ring slot lives
+        return frame_reader.latest_frame(scene_name, copy=True)
+    return decode_frame(take_screenshot(cl, scene_name, CAPTURE_PROFILE))
 
 # Check the current program scene for a person
 def check_current_program_scene():
-    global person_in_current_scene
     global current_scene_name
     current_scene = cl.get_current_program_scene()
     current_scene_name = current_scene.current_program_scene_name
     print(f"Processing current program scene: {current_scene_name}")
     
-    response = cl.get_source_screenshot(name=current_scene_name, img_format="jpg", width=1280, height=720, quality=100)
-    base64_image = response.image_data.split(',')[1]
+    img = capture_scene(current_scene_name)
     # snapshot_filename = os.path.join(snapshot_folder, f"{current_scene_name}.jpg")
     
-    if image_has_person_in_scene(base64_image):
-        # print(f"    Person detected in current program scene: {current_scene_name}")
-        person_in_current_scene = True
-    else:
-        person_in_current_scene = False
-    #     print(f"    No person detected in current program scene: {current_scene_name}")
+    person = image_has_person_in_scene(img, current_scene_name)
+    if person is not None:
+        scene_state.merge({current_scene_name: person}, current_scene_name)
+        publish_status()
     
     # Sleep to prevent overwhelming the OBS WebSocket server
     time.sleep(1)
 
 # Check other scenes for people
 def check_other_scenes():
-    global scenes_with_people
     for scene_name in SCENE_LIST:
         if scene_name == cl.get_current_program_scene():
             continue
         
         print(f"Processing scene: {scene_name}")
-        response = cl.get_source_screenshot(name=scene_name, img_format="jpg", width=1280, height=720, quality=100)
-        base64_image = response.image_data.split(',')[1]
+        img = capture_scene(scene_name)
         # snapshot_filename = os.path.join(snapshot_folder, f"{scene_name}.jpg")
         
-        if image_has_person_in_scene(base64_image):
-            # print(f"    Person detected in scene: {scene_name}")
-            if scene_name not in scenes_with_people:
-                scenes_with_people.append(scene_name)
-        else:
-            if scene_name in scenes_with_people:
-                scenes_with_people.remove(scene_name)
-        #     print(f"    No person detected in scene: {scene_name}")
+        person = image_has_person_in_scene(img, scene_name)
+        if person is not None:
+            scene_state.merge({scene_name: person})
+            publish_status()
         
         # Sleep to prevent overwhelming the OBS WebSocket server
         time.sleep(0.8)
 
+# Screenshot the program scene and every scene in SCENE_LIST, then detect people in the changed ones in one batch
+def sweep_all_scenes():
+    global current_scene_name
+    current_scene_name = cl.get_current_program_scene().current_program_scene_name
+    sweep_scenes = [current_scene_name] + [scene for scene in SCENE_LIST if scene != current_scene_name]
+    print(f"Processing {len(sweep_scenes)} scenes in one batch")
+
+    has_person = detect_people((scene_name, capture_scene(scene_name)) for scene_name in sweep_scenes)
+
+    scene_state.merge(has_person, current_scene_name)
+    publish_status()
+
+# Keep track of the program and preview scenes from OBS events instead of polling for them
+def on_current_program_scene_changed(data):
+    global current_scene_name
+    current_scene_name = data.scene_name
+    scan_wakeup.set()
+
+def on_current_preview_scene_changed(data):
+    global current_preview_scene_name
+    current_preview_scene_name = data.scene_name
+    scan_wakeup.set()
+
+def watch_obs_scenes():
+    global current_scene_name
+    global current_preview_scene_name
+    current_scene_name = cl.get_current_program_scene().current_program_scene_name
+    try:
+        current_preview_scene_name = cl.get_current_preview_scene().current_preview_scene_name
+    except Exception:
+        # Studio mode is off, so there is no preview scene yet
+        current_preview_scene_name = None
+    events = event_client or obs.EventClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+    events.callback.register([on_current_program_scene_changed, on_current_preview_scene_changed])
+    return events
+
+# Rescan whichever scenes the scheduler says are due, then sleep until the next one is
+def run_scheduled_checks():
+    events = watch_obs_scenes()
+    while True:
+        program_scene = current_scene_name
+        preview_scene = current_preview_scene_name
+        batch = scan_scheduler.next_batch(time.time(), program_scene, preview_scene)
+        if batch:
+            has_person = detect_people((scene_name, capture_scene(scene_name)) for scene_name in batch)
+            now = time.time()
+            for scene_name, result in has_person.items():
+                scan_scheduler.record(scene_name, result, now)
+
+            scene_state.merge(has_person, program_scene)
+            publish_status()
+
+        due = time.time() + scan_scheduler.time_until_next(time.time(), current_scene_name, current_preview_scene_name)
+        woken = scan_wakeup.wait(max(0.0, due - time.time()))
+        scan_wakeup.clear()
+        if not woken:
+            # Early wake-ups for scene changes are on time by definition
+            metrics.record_loop_lag("scan", due)
+
+# Capture and check one scene right away, ahead of the scan schedule, e.g. before the
+# director cuts to it. Called from request threads while the scan thread keeps running.
+# "person" is None if there is no frame of the scene yet; the last result then stands.
+def check_scene(scene):
+    start = time.time()
+    with CHECK_SECONDS.time():
+        person = image_has_person_in_scene(capture_scene(scene), scene, priority=True)
+    if person is not None:
+        scan_scheduler.record(scene, person, time.time())
+        scene_state.merge({scene: person}, current_scene_name)
+        publish_status()
+    return {"scene": scene, "person": person, "seconds": round(time.time() - start, 3)}
+
+def current_status():
+    return scene_state.status()
+
+# Push the status to stream subscribers (no-op if nothing changed)
+def publish_status():
+    status_broadcaster.publish(current_status())
+    readiness.set_ready()
+
 # Flask route to return the current status as JSON
 @app.route('/status', methods=['GET'])
 def get_status():
+    # Statistics are left out of the /events stream so they don't trigger pushes
     return jsonify({
-        'person_in_current_scene': person_in_current_scene,
-        'scenes_with_people': scenes_with_people
+        **current_status(),
+        'detection_cache': detection_cache.stats(),
+        'scan_scheduler': scan_scheduler.stats(time.time(), current_scene_name, current_preview_scene_name),
+        'person_tracker': person_tracker.stats() if person_tracker is not None else None,
     })
 
+# Check ?scene= now and return the fresh result, e.g. {"scene": "Camera 2", "person": true, "seconds": 0.08}
+@app.route('/check', methods=['POST'])
+def post_check():
+    scene = request.args.get("scene")
+    if scene not in SCENE_LIST:
+        return jsonify({"error": f"unknown scene {scene!r}"}), 404
+    if not readiness.ready:
+        return jsonify(readiness.status()), 503
+    result = check_scene(scene)
+    if result["person"] is None:
+        return jsonify({**result, "error": "no frame of the scene yet"}), 503
+    return jsonify(result)
+
+# Prometheus metrics of this service's hot paths
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+# 200 once the status can be trusted, 503 while the model is still loading
+@app.route('/ready', methods=['GET'])
+def get_ready():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+# Flask route streaming every status change as Server-Sent Events
+@app.route('/events', methods=['GET'])
+def stream_status():
+    return Response(status_broadcaster.sse_stream(), mimetype="text/event-stream")
+
+# Load the detector (or start the worker pool) and run it once on a blank frame,
+# so the first real sweep doesn't pay for initialisation
+def load_detector():
+    global detector, detector_pool
+    warm_up_size = (CAPTURE_PROFILE["width"], CAPTURE_PROFILE["height"])
+    readiness.set_stage("loading model")
+    if WORKERS > 0:
+        detector_pool = DetectorPool(
+            SCENE_CONFIG.get("detector", {}),
+            confidence=PERSON_CONFIDENCE,
+            workers=WORKERS,
+            threads=SCENE_CONFIG.get("worker_threads"),
+            queue_size=SCENE_CONFIG.get("queue_size"),
+            boxes=person_tracker is not None,
+            warm_up_size=warm_up_size,
+            # A worker of its own for /check, so a pre-cut check doesn't queue behind a sweep
+            check_worker=SCENE_CONFIG.get("check_worker", True),
+        )
+        # Each worker warms up its own model as it starts
+        detector_pool.wait_ready()
+        print(f"Started {WORKERS} detector workers{' and a check worker' if detector_pool.check_worker else ''} with {detector_pool.threads} threads each")
+    else:
+        model = create_detector(SCENE_CONFIG.get("detector", {}), confidence=PERSON_CONFIDENCE)
+        readiness.set_stage("warming up")
+        # A full sweep is one batch of every scene, so that's the shape worth warming up too
+        batch_sizes = (1, len(SCENE_LIST)) if SWEEP_MODE == "batch" else (1,)
+        warm_up(model, *warm_up_size, batch_sizes=batch_sizes, boxes=person_tracker is not None)
+        detector = model
+    readiness.set_stage("first sweep")
+
 # Function to run the checks and continuously update status
 def run_checks():
+    load_detector()
+    if SWEEP_MODE == "adaptive":
+        run_scheduled_checks()
+        return
+
     while True:
-        check_current_program_scene()
-        check_other_scenes()
+        if SWEEP_MODE == "batch":
+            sweep_all_scenes()
+        else:
+            check_current_program_scene()
+            check_other_scenes()
         # Sleep to prevent overwhelming the OBS WebSocket server
         time.sleep(2)  # Adjust the delay as needed
 
-# Run the checks in a separate thread
-thread = threading.Thread(target=run_checks)
-thread.daemon = True
-thread.start()
+# Connect to OBS and run the checks in a separate thread; the model is loaded there,
+# so the web server answers /ready right away.
+# The all-in-one runtime passes the OBS clients it shares with the other services.
+def start(req_client=None, events=None):
+    global cl, event_client
+    readiness.set_stage("connecting to OBS")
+    # /check requests take screenshots from Flask's threads alongside the scan thread
+    cl = req_client or SharedReqClient(obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3))
+    event_client = events
+
+    thread = threading.Thread(target=run_checks)
+    thread.daemon = True
+    thread.start()
 
 # Start Flask web server
 if __name__ == "__main__":
+    start()
     app.run(host="0.0.0.0", port=3853)  # Run on all interfaces, port 3853
@@ -0,0 +1,94 @@
+import time
+import cv2
+
+
+class PersonTracker:
+    """
+    Confirms between full detections that the people found in a scene are
+    still there, so the model only has to run on keyframes.
+
+    A keyframe stores a small grayscale patch of every person the detector
+    found. On later frames each patch is looked for (normalised
+    cross-correlation) in a window around where it was last seen. While at
+    least one person still matches with `min_score` or better, the scene
+    counts as having a person without running the model. `check()` returns
+    None, so a full detection is forced, once the keyframe is older than
+    `keyframe_interval` or nobody matches any more.
+    """
+
+    def __init__(self, keyframe_interval=5.0, min_score=0.6, search_margin=0.5, analysis_width=320, min_patch=8):
+        self.keyframe_interval = keyframe_interval
+        self.min_score = min_score
+        self.search_margin = search_margin
+        self.analysis_width = analysis_width
+        self.min_patch = min_patch
+        self._scenes = {}  # scene name -> {"time": keyframe time, "people": [{"patch", "box"}]}
+
+        self.keyframes = 0
+        self.tracked = 0
+        self.lost = 0
+
+    def _prepare(self, img):
+        """Grayscale copy of a BGR frame at analysis_width, and the scale applied."""
+        scale = min(1.0, self.analysis_width / img.shape[1])
+        if scale < 1.0:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), scale
+
+    def keyframe(self, scene_name, img, boxes, now=None):
+        """Start tracking the people (detector boxes in pixels) found in a fully analysed frame."""
+        self.keyframes += 1
+        gray, scale = self._prepare(img)
+        people = []
+        for x1, y1, x2, y2, *_ in boxes:
+            left, top = max(0, int(x1 * scale)), max(0, int(y1 * scale))
+            right, bottom = min(gray.shape[1], int(x2 * scale)), min(gray.shape[0], int(y2 * scale))
+            if right - left >= self.min_patch and bottom - top >= self.min_patch:
+                people.append({"patch": gray[top:bottom, left:right].copy(), "box": (left, top)})
+        if people:
+            self._scenes[scene_name] = {"time": now or time.time(), "people": people}
+        else:
+            # Nobody to follow; the detection cache covers unchanged empty scenes
+            self._scenes.pop(scene_name, None)
+
+    def check(self, scene_name, img, now=None):
+        """True if a tracked person is still in the frame, None if the detector has to run."""
+        entry = self._scenes.get(scene_name)
+        if entry is None:
+            return None
+        if (now or time.time()) - entry["time"] >= self.keyframe_interval:
+            del self._scenes[scene_name]
+            return None
+
+        gray, _ = self._prepare(img)
+        found = False
+        for person in entry["people"]:
+            patch = person["patch"]
+            patch_height, patch_width = patch.shape
+            left, top = person["box"]
+            margin_x, margin_y = int(patch_width * self.search_margin), int(patch_height * self.search_margin)
+            window_left, window_top = max(0, left - margin_x), max(0, top - margin_y)
+            window = gray[window_top:top + patch_height + margin_y, window_left:left + patch_width + margin_x]
+            if window.shape[0] < patch_height or window.shape[1] < patch_width:
+                continue
+            _, score, _, location = cv2.minMaxLoc(cv2.matchTemplate(window, patch, cv2.TM_CCOEFF_NORMED))
+            if score >= self.min_score:
+                # Follow the person; the patch itself stays the keyframe's so errors don't accumulate
+                person["box"] = (window_left + location[0], window_top + location[1])
+                found = True
+
+        if not found:
+            self.lost += 1
+            del self._scenes[scene_name]
+            return None
+        self.tracked += 1
+        return True
+
+    def stats(self):
+        checks = self.tracked + self.keyframes
+        return {
+            "keyframes": self.keyframes,
+            "tracked": self.tracked,
+            "lost": self.lost,
+            "tracked_share": round(self.tracked / checks, 3) if checks else 0.0,
+        }
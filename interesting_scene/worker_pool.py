@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+import multiprocessing
+from common import metrics
+
+POOL_SECONDS = metrics.histogram("detector_pool_seconds", "One frame from submission to the detector pool until its result is back")
+QUEUE_DEPTH = metrics.gauge("detector_pool_queue_depth", "Frames submitted to the detector pool and not answered yet")
+
+# Thread counts read by the math libraries (OpenMP, OpenBLAS, MKL) when they are first loaded
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# The detector of this worker process, loaded once when the worker starts
+_detector = None
+
+
+def spawn_pool(workers, threads, initializer, initargs=()):
+    """
+    Start a multiprocessing pool whose workers use `threads` CPU threads
+    each, so they share the cores instead of each using all of them.
+
+    The workers are spawned, not forked: the parent already runs threads
+    and may hold model library state. OpenBLAS and MKL size their thread
+    pools when numpy is imported, which a spawned worker does before the
+    initializer runs, so the limits are put in the environment the workers
+    start with. The initializer calls `limit_threads()` for the libraries
+    that can still be changed at runtime.
+    """
+    saved = {name: os.environ.get(name) for name in THREAD_ENV}
+    os.environ.update({name: str(threads) for name in THREAD_ENV})
+    try:
+        return multiprocessing.get_context("spawn").Pool(workers, initializer=initializer, initargs=initargs)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def limit_threads(threads, detector=None):
+    """In a pool worker: cap OpenCV's threads, and torch's if the detector runs on it."""
+    import cv2
+    cv2.setNumThreads(threads)
+    if detector is not None and detector.name == "ultralytics":
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _init_worker(detector_config, confidence, threads, warm_up_size, boxes, warmed_up):
+    global _detector
+    from interesting_scene.detectors import create_detector, warm_up
+    _detector = create_detector({**detector_config, "threads": threads}, confidence=confidence)
+    limit_threads(threads, _detector)
+    warm_up(_detector, *warm_up_size, boxes=boxes)
+    with warmed_up.get_lock():
+        warmed_up.value += 1
+
+
+def _detect(image, boxes):
+    if boxes:
+        return _detector.person_boxes([image])[0]
+    return _detector.has_person([image])[0]
+
+
+class DetectorPool:
+    """
+    Person detection on a pool of worker processes, each with its own copy
+    of the model, so a sweep uses every core instead of one.
+
+    The workers are started, load their model and warm it up on a blank
+    `warm_up_size` frame up front; `wait_ready()` blocks until all of them
+    have. Frames are submitted one at a time, so they can be handed over
+    while later scenes are still being captured. At most `queue_size` frames may be waiting or
+    running at once: `submit()` blocks beyond that, so capture can't run
+    ahead of inference.
+
+    With `check_worker` set, one more worker is kept apart for priority
+    frames (`submit(image, priority=True)`, e.g. an on-demand check). They
+    skip the queue limit and don't wait behind the frames already queued,
+    so a check waits for at most one inference.
+
+    With `boxes` set, results are the people's boxes (for tracking) instead
+    of True/False.
+    """
+
+    def __init__(self, detector_config, confidence=0.55, workers=2, threads=None, queue_size=None, boxes=False,
+                 warm_up_size=(640, 360), check_worker=False):
+        self.workers = workers
+        self.check_worker = check_worker
+        self.boxes = boxes
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.queue_size = queue_size or 2 * workers
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Number of workers that have finished warming up their model
+        self._warmed_up = multiprocessing.get_context("spawn").Value("i", 0)
+        initargs = (detector_config, confidence, self.threads, warm_up_size, boxes, self._warmed_up)
+        self._pool = spawn_pool(workers, self.threads, _init_worker, initargs)
+        self._check_pool = spawn_pool(1, self.threads, _init_worker, initargs) if check_worker else None
+
+    def wait_ready(self, poll_interval=0.1):
+        """Block until every worker has loaded and warmed up its model."""
+        while self._warmed_up.value < self.workers + bool(self.check_worker):
+            time.sleep(poll_interval)
+
+    def submit(self, image, priority=False):
+        """Queue one frame. Returns an AsyncResult whose get() is the frame's result."""
+        if priority and self._check_pool is not None:
+            return self._check_pool.apply_async(_detect, (image, self.boxes))
+        self._slots.acquire()
+        self._track(1)
+        start = time.perf_counter()
+
+        def done(_):
+            POOL_SECONDS.observe(time.perf_counter() - start)
+            self._track(-1)
+            self._slots.release()
+
+        return self._pool.apply_async(_detect, (image, self.boxes), callback=done, error_callback=done)
+
+    def has_person(self, images):
+        """Same as Detector.has_person, spread over the workers."""
+        return [bool(result.get()) for result in [self.submit(image) for image in images]]
+
+    def _track(self, delta):
+        with self._lock:
+            self._pending += delta
+            QUEUE_DEPTH.set(self._pending)
+
+    def close(self):
+        self._pool.terminate()
+        if self._check_pool is not None:
+            self._check_pool.terminate()
@@ -0,0 +1,128 @@
+import heapq
+from collections import deque
+import cv2
+import numpy as np
+
+
+class MotionRing:
+    """
+    Preallocated ring of small grayscale + chroma frames of the projector feed,
+    with an allocation-free change score between any two of them.
+
+    Each pushed frame is cropped to the region of interest (a view), shrunk
+    to `size` and split into a grayscale plane and a chroma plane (HSV
+    saturation). Every buffer, including the scratch space for scoring, is
+    allocated once up front.
+
+    The score of two frames is the weighted share of pixels whose grayscale
+    value changed by more than `pixel_threshold`. Changed pixels that are
+    colored (saturation above `chroma_threshold`) in either frame count
+    `color_weight` times, so the score lies between 0 and `color_weight`.
+    """
+
+    def __init__(self, slots, size=(160, 90), roi=None, pixel_threshold=5,
+                 chroma_threshold=40, color_weight=1.0):
+        width, height = size
+        self.size = (width, height)
+        self.roi = roi  # (x, y, width, height) as fractions of the frame, None for the whole frame
+        self.pixel_threshold = pixel_threshold
+        self.chroma_threshold = chroma_threshold
+        self.color_weight = color_weight
+        self.pixels = width * height
+
+        self.gray = np.zeros((slots, height, width), dtype=np.uint8)
+        self.chroma = np.zeros((slots, height, width), dtype=np.uint8)
+        self.count = 0  # Frames pushed so far; the newest is in slot (count - 1) % slots
+
+        # Scratch buffers reused by every push/score
+        self._small = np.empty((height, width, 3), dtype=np.uint8)
+        self._hsv = np.empty((height, width, 3), dtype=np.uint8)
+        self._changed = np.empty((height, width), dtype=np.uint8)
+        self._colored = np.empty((height, width), dtype=np.uint8)
+
+    @property
+    def slots(self):
+        return len(self.gray)
+
+    def _crop(self, frame):
+        if self.roi is None:
+            return frame
+        frame_height, frame_width = frame.shape[:2]
+        x, y, width, height = self.roi
+        left, top = int(x * frame_width), int(y * frame_height)
+        return frame[top:top + max(1, int(height * frame_height)), left:left + max(1, int(width * frame_width))]
+
+    def push(self, frame):
+        """Add a BGR frame of any size to the ring."""
+        slot = self.count % self.slots
+        cv2.resize(self._crop(frame), self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self.gray[slot])
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2HSV, dst=self._hsv)
+        np.copyto(self.chroma[slot], self._hsv[:, :, 1])
+        self.count += 1
+
+    def _slot(self, age):
+        """Slot of the frame pushed `age` frames before the newest one."""
+        return (self.count - 1 - age) % self.slots
+
+    def score(self, age_a, age_b=0):
+        """Change score between the frames `age_a` and `age_b` pushes ago."""
+        changed, colored_changed = self.score_parts(age_a, age_b, colored=self.color_weight != 1.0)
+        return changed + (self.color_weight - 1) * colored_changed
+
+    def score_parts(self, age_a, age_b=0, colored=True):
+        """
+        Share of changed pixels and share of changed colored pixels between
+        two frames; the score is `changed + (color_weight - 1) * colored`.
+        """
+        a, b = self._slot(age_a), self._slot(age_b)
+
+        cv2.absdiff(self.gray[a], self.gray[b], dst=self._changed)
+        cv2.threshold(self._changed, self.pixel_threshold, 1, cv2.THRESH_BINARY, dst=self._changed)
+        changed = cv2.countNonZero(self._changed)
+        if not colored or changed == 0:
+            return changed / self.pixels, 0.0
+
+        cv2.max(self.chroma[a], self.chroma[b], dst=self._colored)
+        cv2.threshold(self._colored, self.chroma_threshold, 1, cv2.THRESH_BINARY, dst=self._colored)
+        cv2.bitwise_and(self._colored, self._changed, dst=self._colored)
+        return changed / self.pixels, cv2.countNonZero(self._colored) / self.pixels
+
+
+class MotionWindow:
+    """
+    Change scores of consecutive frame pairs over the last `window` seconds.
+
+    The window's score is its `min_moving`-th highest pair score, so it only
+    rises once several pairs changed: a slide change is a single changed
+    pair and doesn't look like video, while continuous motion does as soon
+    as `min_moving` pairs have seen it, however fast frames are sampled.
+
+    Motion thresholds were calibrated on frames `window` seconds apart. Slow
+    motion or a fade changes a pair taken `gap` seconds apart only about
+    gap / window as much, so pair scores passed with their `gap` are scaled
+    up by the inverse. One threshold then fits every capture rate.
+    """
+
+    def __init__(self, window=0.75, min_moving=2):
+        self.window = window
+        self.min_moving = min_moving
+        self._pairs = deque()  # (time of the newer frame, score), oldest first
+
+    def add(self, timestamp, score, gap=None):
+        if gap is not None:
+            score *= max(1.0, self.window / max(gap, 1e-3))
+        self._pairs.append((timestamp, score))
+        while self._pairs[0][0] <= timestamp - self.window:
+            self._pairs.popleft()
+
+    def clear(self):
+        self._pairs.clear()
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def score(self):
+        if len(self._pairs) < self.min_moving:
+            return 0.0
+        return heapq.nlargest(self.min_moving, (score for _, score in self._pairs))[-1]
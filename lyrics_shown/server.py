@@ -1,14 +1,17 @@
 import os
+import sys
 import json
 import time
-import base64
 import obsws_python as obs
-from PIL import Image
-from io import BytesIO
-import cv2
-import numpy as np
-from collections import deque
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics
+from common.events import StateBroadcaster
+from common.readiness import Readiness
+from common.frames import capture_profile, take_screenshot, decode_frame
+from common.frame_ring import FrameRingReader
+from lyrics_shown.motion import MotionRing, MotionWindow
 
 config = None
 with open("../config.json", "r") as file:
@@ -17,85 +20,175 @@ with open("../config.json", "r") as file:
 # Flask app setup
 app = Flask(__name__)
 
-# Connect to OBS WebSocket
-cl = obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
-
-# Function to decode and convert Base64 image to OpenCV format (numpy array)
-def load_image_from_base64(base64_data):
-    img_data = base64.b64decode(base64_data)
-    img = Image.open(BytesIO(img_data))
-    img_cv = np.array(img)
-    img_cv = cv2.cvtColor(img_cv, cv2.COLOR_RGB2BGR)  # Convert PIL to OpenCV format
-    return img_cv
-
-# Function to compare images using OpenCV (motion detection) with multiplier for non-grayscale pixels
-def compare_images(img1, img2, threshold=100000, color_multiplier=30):
-    # Convert images to grayscale
-    gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-    
-    # Compute absolute difference between images
-    diff = cv2.absdiff(gray1, gray2)
-
-    # Threshold the difference image to detect changes
-    _, thresh = cv2.threshold(diff, 5, 255, cv2.THRESH_BINARY)  # Lowered threshold for more sensitivity
-
-    # Identify non-grayscale pixels in the RGB difference
-    diff_rgb = cv2.absdiff(img1, img2)
-
-    # Create a mask where non-grayscale pixels have a non-zero difference
-    non_grayscale_mask = np.any(diff_rgb != 0, axis=-1)  # Check if any of the RGB channels have a difference
-
-    # Apply the color multiplier to non-grayscale pixels
-    thresh[non_grayscale_mask] *= color_multiplier
-
-    # Count non-zero pixels (which indicates motion/scene change)
-    non_zero_count = np.count_nonzero(thresh)
-    return non_zero_count > threshold
-
-# Initialize variables
-image_buffer = deque(maxlen=5)  # Rolling buffer to store last 5 images
+# The motion diff doesn't need 720p; a smaller capture is cheaper to encode, send and decode
+CAPTURE_PROFILE = capture_profile(config, "lyrics_shown", width=640, height=360, quality=90)
+
+cl = None
+frame_reader = None
+if config.get("frame_capture", {}).get("enabled"):
+    # Read frames published by the frame_capture service instead of taking our own screenshots
+    frame_reader = FrameRingReader()
+
+# Connect to OBS WebSocket, unless frames come from the frame_capture service.
+# The all-in-one runtime passes the client it shares with the other services.
+def connect(req_client=None):
+    global cl
+    if frame_reader is None:
+        cl = req_client or obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+
+LYRICS_CONFIG = config.get("lyrics_shown", {})
+ANALYSIS_SIZE = tuple(LYRICS_CONFIG.get("analysis_size", [160, 90]))
+# While the projector is static it is only probed, with a screenshot no bigger than the analysis size,
+# at half the old 4 per second full-size rate
+PROBE_INTERVAL = LYRICS_CONFIG.get("probe_interval", 0.5)
+PROBE_PROFILE = capture_profile(config, "lyrics_shown_probe", width=ANALYSIS_SIZE[0], height=ANALYSIS_SIZE[1], quality=90)
+# Once a frame pair changes by more than PROBE_THRESHOLD, full captures are taken every ACTIVE_INTERVAL
+# until nothing has changed for ACTIVE_HOLD seconds. 5 per second is only a little above the old
+# constant rate, and still gives the window a few pairs to decide on.
+ACTIVE_INTERVAL = LYRICS_CONFIG.get("active_interval", 0.2)
+PROBE_THRESHOLD = LYRICS_CONFIG.get("probe_threshold", 0.01)
+# Video is decided on the consecutive frame pairs of the last COMPARE_WINDOW seconds
+COMPARE_WINDOW = LYRICS_CONFIG.get("compare_window", 0.75)
+MIN_MOVING_PAIRS = LYRICS_CONFIG.get("min_moving_pairs", 2)
+# Staying active for at least the window means its last changed pairs have aged out before probing again
+ACTIVE_HOLD = max(LYRICS_CONFIG.get("active_hold", 2.0), COMPARE_WINDOW)
+# Share of (weighted) changed pixels above which the projector counts as showing video, between
+# frames COMPARE_WINDOW apart (closer pairs are scaled to that gap); the default matches the
+# old 100000 changed pixels out of a 1280x720 frame
+MOTION_THRESHOLD = LYRICS_CONFIG.get("motion_threshold", 100000 / (1280 * 720))
+
+# Probes and full captures are scaled differently, so each kind is only compared with its own kind
+motion_rings = {
+    kind: MotionRing(
+        slots=2,
+        size=ANALYSIS_SIZE,
+        roi=LYRICS_CONFIG.get("roi"),
+        pixel_threshold=LYRICS_CONFIG.get("pixel_threshold", 5),
+        chroma_threshold=LYRICS_CONFIG.get("chroma_threshold", 40),
+        color_weight=LYRICS_CONFIG.get("color_weight", 1.0),
+    )
+    for kind in ("probe", "active")
+}
+motion_window = MotionWindow(window=COMPARE_WINDOW, min_moving=MIN_MOVING_PAIRS)
+frame_times = {"probe": None, "active": None}  # When the newest frame of each kind was taken
 lyrics_shown = True
+motion_score = 0.0
+capture_mode = "active"  # Until the first comparisons show the projector is static
+lyrics_broadcaster = StateBroadcaster({"lyrics_shown": lyrics_shown})
+# Until enough frame pairs are compared lyrics_shown is only the default, so the service isn't ready yet
+readiness = Readiness("lyrics_shown")
 projector_scene = config["obs"]["scenes"]["projector_scene"]
 print(f"Processing scene: {projector_scene}")
 
-# Main loop for capturing screenshots and detecting motion
-def capture_loop():
+MOTION_SECONDS = metrics.histogram("motion_score_seconds", "Pushing a frame into the motion ring and scoring it")
+MOTION_SCORE = metrics.gauge("motion_score", "Latest projector motion score")
+CAPTURES = metrics.counter("projector_captures_total", "Projector frames captured, by kind (low-res probe, full capture or new shared frame)")
+
+# Get the latest projector frame (a low-res probe or a full capture) and its frame_capture
+# sequence number (None for our own screenshots)
+def capture_frame(kind):
+    if frame_reader is not None:
+        return frame_reader.latest(projector_scene)
+    CAPTURES.inc(kind=kind)
+    return decode_frame(take_screenshot(cl, projector_scene, CAPTURE_PROFILE if kind == "active" else PROBE_PROFILE)), None
+
+# Compare a frame with the previous one of its kind and update lyrics_shown from the window.
+# Returns the pair's score, or None if there is no recent frame of the same kind to compare with.
+def score_frame(kind, img, now, previous_kind):
     global lyrics_shown
+    global motion_score
+    ring = motion_rings[kind]
+    with MOTION_SECONDS.time():
+        # Shrink into the preallocated ring (this also copies frames out of shared memory)
+        ring.push(img)
+        previous_time, frame_times[kind] = frame_times[kind], now
+        if ring.count < 2 or previous_kind != kind:
+            # The ring's previous frame is from before the last mode switch
+            return None
+        pair_score = ring.score(1)
+        # Scaled to the compare_window gap MOTION_THRESHOLD was calibrated on
+        motion_window.add(now, pair_score, gap=now - previous_time)
+        motion_score = motion_window.score()
+    MOTION_SCORE.set(motion_score)
+
+    # If motion/scene change is above the threshold, set lyrics_shown to False
+    lyrics_shown = motion_score <= MOTION_THRESHOLD
+
+    # Push the change to stream subscribers right away
+    lyrics_broadcaster.publish({"lyrics_shown": lyrics_shown})
+    if len(motion_window) >= MIN_MOVING_PAIRS:
+        readiness.set_ready()
+    return pair_score
+
+# Main loop: probe the projector at a low rate and resolution while it's static, and capture
+# it at the full rate as soon as anything changes
+def capture_loop():
+    global capture_mode
+    readiness.set_stage("comparing first frames")
+    last_change = time.time()  # Start active, so the first decision comes quickly
+    previous_kind = None
+    previous_seq = None
+    scheduled = time.time()
     while True:
-        # Get the screenshot (Base64 encoded)
-        response = cl.get_source_screenshot(name=projector_scene, img_format="jpg", width=1280, height=720, quality=100)
-        base64_image = response.image_data.split(',')[1]
-        img = load_image_from_base64(base64_image)
-
-        # Add image to buffer (rolling buffer automatically discards the oldest image if maxlen is reached)
-        image_buffer.append(img)
-
-        # Once the buffer has 4 images, compare the first and last
-        if len(image_buffer) == 4:
-            # Compare the first image (oldest) with the last image (most recent)
-            motion_detected = compare_images(image_buffer[0], image_buffer[-1])
-
-            # If motion/scene change is above the threshold, set lyrics_shown to False
-            if motion_detected:
-                lyrics_shown = False
-                # print("Motion detected, lyrics_shown set to False.")
+        iteration_start = time.time()
+        metrics.record_loop_lag("capture", scheduled, iteration_start)
+
+        kind = "active" if iteration_start - last_change < ACTIVE_HOLD else "probe"
+        if frame_reader is not None:
+            # Shared frames are full size whatever the mode; the mode only sets how often they're read
+            kind = "active"
+        img, seq = capture_frame(kind)
+        if seq is not None:
+            if seq == previous_seq:
+                # frame_capture hasn't published a new frame; comparing it with itself would add a zero pair
+                img = None
             else:
-                lyrics_shown = True
-                # print("No significant motion detected, lyrics_shown set to True.")
-
-        # Delay between captures (adjust as necessary)
-        time.sleep(0.25)  # Sleep for 1 second before capturing the next image
+                previous_seq = seq
+                CAPTURES.inc(kind="shared")
+        if img is not None:
+            pair_score = score_frame(kind, img, iteration_start, previous_kind)
+            previous_kind = kind
+            if pair_score is not None and pair_score > PROBE_THRESHOLD:
+                last_change = iteration_start
+                if kind == "probe":
+                    # Take the first full capture right away rather than one probe interval later
+                    kind = "active"
+                    img, _ = capture_frame(kind)
+                    if img is not None:
+                        score_frame(kind, img, time.time(), None)
+                        previous_kind = kind
+
+        capture_mode = "active" if time.time() - last_change < ACTIVE_HOLD else "probe"
+        scheduled = iteration_start + (ACTIVE_INTERVAL if capture_mode == "active" else PROBE_INTERVAL)
+        time.sleep(max(0.0, scheduled - time.time()))
 
 # API endpoint to get the current value of lyrics_shown
 @app.route('/data', methods=['GET'])
 def get_lyrics_shown():
-    return jsonify({"lyrics_shown": lyrics_shown})
+    return jsonify({"lyrics_shown": lyrics_shown, "motion_score": round(motion_score, 4), "capture_mode": capture_mode})
+
+# Prometheus metrics of this service's hot paths
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+# 200 once lyrics_shown comes from a real comparison, 503 before
+@app.route('/ready', methods=['GET'])
+def get_ready():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+# Stream every change of lyrics_shown as Server-Sent Events
+@app.route('/events', methods=['GET'])
+def stream_lyrics_shown():
+    return Response(lyrics_broadcaster.sse_stream(), mimetype="text/event-stream")
 
 # Start the Flask app in a separate thread and the capture loop in the main thread
 if __name__ == "__main__":
     from threading import Thread
 
+    connect()
+
     # Start the Flask server
     flask_thread = Thread(target=app.run, kwargs={"host": "0.0.0.0", "port": 4932, "debug": False})
     flask_thread.daemon = True
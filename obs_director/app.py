@@ -1,231 +1,360 @@
 import asyncio
+import math
 import random
 import time
-import websockets
-import requests
+import os
+import sys
 import json
+import aiohttp
 import obsws_python as obs
 from aiohttp import web
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics
+from obs_director.signal_client import create_signal_clients, wait_until_ready
+from obs_director.obs_state import ObsStateMirror
+from obs_director.recorder import open_recorder
+
 config = None
 with open("../config.json", "r") as file:
     config = json.load(file)
 
 SCENE_LIST = config["obs"]["scenes"]["list"]
-PTZ_SCENE = config["obs"]["scenes"]["ptz_scene"]
 PROJECTOR_SCENE = config["obs"]["scenes"]["projector_scene"]
 
 SLOW_BPM = config["obs"]["scenes"]["slow_bpm"]
 
-async def fetch_scene_interest():
-    """Fetch data from SCENE_INTEREST_API."""
-    try:
-        response = requests.get(config["scene_interest_api"]["url"])
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to fetch scene interest data: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error fetching scene interest data: {e}")
-        return None
-
-async def get_bpm():
-    """Fetch BPM data from the web service."""
-    try:
-        response = requests.get(config["bpm_api"]["url"])
-        if response.status_code == 200:
-            bpm_data = response.json()
-            return bpm_data["current_bpm"]
-        else:
-            print(f"Failed to fetch BPM data: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error fetching BPM data: {e}")
-        return None
-    
-async def get_ptz_moving():
-    """Fetch PTZ moving data from the web service."""
-    try:
-        response = requests.get(config["ptz_moving_api"]["url"])
-        if response.status_code == 200:
-            data = response.json()
-            return data["moving"]
-        else:
-            print(f"Failed to fetch PTZ moving data: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error fetching PTZ moving data: {e}")
-        return None
-
-async def get_lyrics_shown():
-    """Fetch lyrics_shown status from the lyrics API."""
-    try:
-        response = requests.get(config["lyrics_api"]["url"])
-        if response.status_code == 200:
-            data = response.json()
-            return data["lyrics_shown"]
-        else:
-            print(f"Failed to fetch lyrics status: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error fetching lyrics status: {e}")
-        return None
+# Runs the director's own fixed delays this many times faster; only tools/replay.py sets it,
+# so a sped-up replay keeps the same proportions as the recorded session
+TIME_SCALE = config.get("director", {}).get("time_scale", 1.0)
+
+# Beat grid from the BPM service (optional "beat_api" in config.json)
+CUT_ON_DOWNBEAT = config["obs"]["scenes"].get("cut_on_downbeat", False)
+MIN_BEAT_CONFIDENCE = config["obs"]["scenes"].get("min_beat_confidence", 0.5)
+BEAT_GRID_MAX_AGE = 5 / TIME_SCALE  # Seconds before an un-updated grid is no longer trusted
+CUT_TOLERANCE = 0.001  # A deadline this close counts as reached, as asyncio timers may fire a little early
+# Without music, how long a timed cut waits for the re-check of the preview scene
+PREVIEW_CHECK_WAIT = config.get("scene_interest_api", {}).get("check_timeout", 1.0)
+
+# The director has no API of its own; this port only serves /metrics
+METRICS_PORT = config.get("metrics", {}).get("director_port", 9464)
+OBS_COMMAND_SECONDS = metrics.histogram("obs_command_seconds", "Round trip of one OBS WebSocket request")
+CUTS = metrics.counter("director_cuts_total", "Transitions triggered by the director")
+CUT_LATENESS = metrics.histogram("director_cut_lateness_seconds", "How late a timed transition was sent after its beat-aligned deadline")
+
+# Session recorder for offline replay (see tools/replay.py); None unless recording is enabled
+recorder = None
 
 async def set_preview_scene(cl, scene_name):
     """Set a scene as the preview scene in OBS."""
     print(f"Set preview scene: {scene_name}")
-    cl.set_current_preview_scene(scene_name)
+    if recorder is not None:
+        recorder.record("command", command="SetCurrentPreviewScene", scene=scene_name)
+    # obsws_python is blocking; run commands off the event loop
+    with OBS_COMMAND_SECONDS.time(command="SetCurrentPreviewScene"):
+        await asyncio.to_thread(cl.set_current_preview_scene, scene_name)
 
-async def switch_preview_to_program(cl):
+async def switch_preview_to_program(cl, obs_state=None):
     """Switch the current preview scene to the program scene in OBS."""
-    cl.trigger_studio_mode_transition()
+    if obs_state is not None:
+        obs_state.expect_transition(time.time())
+    if recorder is not None:
+        recorder.record("command", command="TriggerStudioModeTransition")
+    with OBS_COMMAND_SECONDS.time(command="TriggerStudioModeTransition"):
+        await asyncio.to_thread(cl.trigger_studio_mode_transition)
+    CUTS.inc()
     print("Switched preview scene to program scene")
 
-async def main():
-    ptzCameraMoving = False
-    program_scene = None
+def seconds_until_beat(current_time, bpm, beat_grid=None, lead=0.0):
+    """
+    How long to wait before sending a transition so that it lands on the next
+    beat (or downbeat), given that OBS acts on commands `lead` seconds late.
+    Uses the predicted beat grid when it is fresh and confident, otherwise
+    falls back to a grid derived from the BPM alone.
+    """
+    if (beat_grid and beat_grid.get("period")
+            and beat_grid.get("confidence", 0) >= MIN_BEAT_CONFIDENCE
+            and current_time - (beat_grid.get("updated") or 0) < BEAT_GRID_MAX_AGE):
+        if CUT_ON_DOWNBEAT and beat_grid.get("downbeat_time") is not None:
+            anchor, step = beat_grid["downbeat_time"], beat_grid["period"] * beat_grid["beats_per_bar"]
+        else:
+            anchor, step = beat_grid["beat_time"], beat_grid["period"]
+        next_beat = anchor + math.ceil((current_time + lead - anchor) / step) * step
+        return next_beat - lead - current_time
+
+    seconds_per_beat = 60 / bpm
+    return seconds_per_beat - (current_time % seconds_per_beat)
+
+def schedule_next_switch(now, music_playing, bpm):
+    """Time of the next timed cut: a random wait, from the slow range without music or on slow songs."""
+    scenes = config["obs"]["scenes"]
+    if not music_playing or bpm < SLOW_BPM:
+        return now + random.uniform(scenes["wait_min_slow"], scenes["wait_max_slow"])
+    return now + random.uniform(scenes["wait_min"], scenes["wait_max"])
+
+def pick_preview_scene(program_scene_name, scenes_with_people, moving_scenes=()):
+    """
+    Next scene for preview: another scene with people if there is one,
+    otherwise a random scene. Scenes of moving PTZ cameras are never picked.
+    """
+    scenes_with_people = [scene for scene in scenes_with_people if scene not in moving_scenes]
+    if len(scenes_with_people) > 0:
+        if len(scenes_with_people) > 1:
+            return random.choice([scene for scene in scenes_with_people if scene != program_scene_name])
+        elif scenes_with_people[0] != program_scene_name:
+            return scenes_with_people[0]
+        else:
+            return program_scene_name
+    candidates = [scene for scene in SCENE_LIST if scene != program_scene_name and scene not in moving_scenes]
+    return random.choice(candidates) if candidates else program_scene_name
+
+async def start_metrics_server():
+    """Serve Prometheus metrics on METRICS_PORT."""
+    async def handle_metrics(request):
+        return web.Response(body=metrics.REGISTRY.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", METRICS_PORT).start()
+    return runner
+
+async def wait_for_wakeup(wakeup, deadline):
+    """Sleep until `wakeup` is set or `deadline` passes (None: no deadline). Returns True if woken by `wakeup`."""
+    timeout = None if deadline is None else max(0.0, deadline - time.time())
+    try:
+        await asyncio.wait_for(wakeup.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def main(cl=None, events=None, local_signals=None):
+    """
+    Run the director. The all-in-one runtime passes its own OBS request client,
+    the event client it shares with the detectors, and the StateBroadcasters
+    of the detectors it hosts.
+
+    The loop doesn't tick: it sleeps until a signal or OBS event arrives or
+    until the next deadline it can act on (the next timed cut, the beat to
+    send it on, or the end of a stuck transition), then re-evaluates.
+    """
+    global recorder
+    moving_scenes = []
     program_scene_name = ""
-    next_switch_time = 0
+    next_switch_time = None
     last_person_in_scene = None
     scenes_with_people = []
 
-    # Connect to OBS WebSocket
-    cl = obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+    # A timed cut in progress: when to send the transition, and the re-check of the preview scene
+    cut_time = None
+    preview_check = None
+    realigned = False
+
+    # Set whenever a new signal value or OBS event arrives
+    signal_changed = asyncio.Event()
+
+    # Connect to OBS WebSocket: requests are only used to issue commands,
+    # scene state comes from the event stream
+    owns_obs = cl is None
+    if owns_obs:
+        cl = obs.ReqClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+        events = obs.EventClient(host=config["obs"]["websocket"]["host"], port=config["obs"]["websocket"]["port"], password=config["obs"]["websocket"]["password"], timeout=3)
+    recorder = open_recorder(config)
+    on_obs_change = (lambda field, value: recorder.record("obs", field=field, value=value)) if recorder else None
+    obs_state = ObsStateMirror(cl, events, asyncio.get_running_loop(), wakeup=signal_changed, on_change=on_obs_change)
+    obs_state.TRANSITION_TIMEOUT = ObsStateMirror.TRANSITION_TIMEOUT / TIME_SCALE
     print("Connected to OBS WebSocket")
+    if recorder is not None:
+        # Everything a replay needs to rebuild the session, minus the OBS password
+        recorded_config = {key: value for key, value in config.items() if key != "obs"}
+        recorded_config["obs"] = {"scenes": config["obs"]["scenes"]}
+        recorder.record("start", config=recorded_config, program_scene=obs_state.program_scene, preview_scene=obs_state.preview_scene)
 
-    last_ptz_moving_request_time = 0
-    last_bpm_request_time = 0
-    last_lyrics_request_time = 0
-    last_scene_interest_request_time = 0
-    bpm = 120  # Default BPM
+    bpm = 120 * TIME_SCALE  # Default BPM
+    music_playing = True  # Until the BPM service says otherwise
     next_preview_scene = None
     last_lyrics_shown = None
 
+    # One keep-alive session shared by every detector client
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(keepalive_timeout=60))
+    signals = create_signal_clients(session, config, wakeup=signal_changed, recorder=recorder, local=local_signals)
+    for signal in signals.values():
+        signal.start()
+    metrics_runner = await start_metrics_server()
+    lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag("director"))
+
+    # Give the detectors a moment to warm up rather than cutting on their defaults;
+    # any that take longer are picked up as soon as they're ready
+    not_ready = await wait_until_ready(signals, config.get("signal_client", {}).get("ready_timeout", 30))
+    if not_ready:
+        print(f"Starting without {', '.join(not_ready)} until ready")
+
+    def beat_aligned(now):
+        """When to send a transition started at `now`: on the next beat with music, right away without."""
+        if not music_playing:
+            return now
+        beat_grid = signals["beats"].value if "beats" in signals else None
+        time_until_next_beat = seconds_until_beat(now, bpm, beat_grid, obs_state.command_latency)
+        print(f"Waiting {time_until_next_beat:.2f}s for next beat...")
+        return now + time_until_next_beat
+
+    def cancel_timed_cut():
+        nonlocal cut_time, preview_check
+        cut_time = None
+        if preview_check is not None:
+            preview_check.cancel()
+            preview_check = None
+
+    async def cut_now(scene_name, now):
+        """Cut straight to a scene, dropping any timed cut in progress."""
+        nonlocal next_switch_time
+        cancel_timed_cut()
+        await set_preview_scene(cl, scene_name)
+        await asyncio.sleep(0.1 / TIME_SCALE)
+        await switch_preview_to_program(cl, obs_state)
+        next_switch_time = schedule_next_switch(now, music_playing, bpm)
+
     try:
         while True:
+            # Sleep until something changes or the next deadline that can be acted on in this state
+            if obs_state.transitioning:
+                # Its end wakes us up; the timeout covers a SceneTransitionEnded that never comes
+                deadline = obs_state.transition_started_time + obs_state.TRANSITION_TIMEOUT
+            elif last_lyrics_shown is False:
+                deadline = None  # Only a lyrics change ends the projector hold
+            elif cut_time is not None:
+                deadline = cut_time
+            else:
+                deadline = next_switch_time
+            await wait_for_wakeup(signal_changed, deadline)
+            signal_changed.clear()
             current_time = time.time()
-            program_scene = cl.get_current_program_scene()
-            program_scene_name = program_scene.current_program_scene_name
-            
-            # Check the lyrics_shown status at the configured interval
-            if current_time - last_lyrics_request_time >= config["lyrics_api"]["poll_interval"]:
-                lyrics_shown = await get_lyrics_shown()
-                if lyrics_shown is not None and lyrics_shown != last_lyrics_shown:
-                    if not lyrics_shown and program_scene_name != PROJECTOR_SCENE:
-                        # Transition to projector scene if lyrics_shown changes to false
-                        await set_preview_scene(cl, PROJECTOR_SCENE)
-                        await asyncio.sleep(0.1)
-                        await switch_preview_to_program(cl)
-                        if bpm < SLOW_BPM:
-                            next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min_slow"], config["obs"]["scenes"]["wait_max_slow"])
-                        else:
-                            next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min"], config["obs"]["scenes"]["wait_max"])
-                    last_lyrics_shown = lyrics_shown
-                last_lyrics_request_time = current_time
+            program_scene_name = obs_state.program_scene
+
+            # Don't stack commands on a running transition; pending updates are handled once it ends
+            if obs_state.transitioning:
+                continue
+
+            # React to a new lyrics_shown value
+            lyrics_updated, lyrics_shown = signals["lyrics"].take_update()
+            if lyrics_updated and lyrics_shown is not None and lyrics_shown != last_lyrics_shown:
+                if not lyrics_shown and program_scene_name != PROJECTOR_SCENE:
+                    # Transition to projector scene if lyrics_shown changes to false
+                    await cut_now(PROJECTOR_SCENE, current_time)
+                last_lyrics_shown = lyrics_shown
 
             # If lyrics_shown is False, skip scene switching
             if last_lyrics_shown is False:
+                cancel_timed_cut()
                 continue
-            
-            # Fetch scene interest data at the configured interval
-            if current_time - last_scene_interest_request_time >= config["scene_interest_api"]["poll_interval"]:
-                # Poll the SCENE_INTEREST_API
-                scene_interest_data = await fetch_scene_interest()
-                if scene_interest_data:
-                    person_in_current_scene = scene_interest_data.get("person_in_current_scene", False)
-                    scenes_with_people = scene_interest_data.get("scenes_with_people", [])
-
-                    if last_person_in_scene is not None and last_person_in_scene and not person_in_current_scene:
-                        # Transition to a random scene if the condition is met
-                        if len(scenes_with_people) > 0:
-                            next_scene = random.choice(scenes_with_people)
-                            print(f"Switching to random scene because current scene has no person in it: {next_scene}")
-                            await set_preview_scene(cl, next_scene)
-                            await asyncio.sleep(0.1)
-                            await switch_preview_to_program(cl)
-                            if bpm < SLOW_BPM:
-                                next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min_slow"], config["obs"]["scenes"]["wait_max_slow"])
-                            else:
-                                next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min"], config["obs"]["scenes"]["wait_max"])
-                            continue
-
-                    last_person_in_scene = person_in_current_scene
-                last_scene_interest_request_time = current_time
-
-            # If PTZ is moving, switch to another scene
-            if current_time - last_ptz_moving_request_time >= config["ptz_moving_api"]["poll_interval"]:
-                ptzCameraMoving = await get_ptz_moving()
-                last_ptz_moving_request_time = current_time
-                
-            if ptzCameraMoving:
-                if program_scene_name == PTZ_SCENE:
+
+            # React to new scene interest data
+            scene_interest_updated, scene_interest_data = signals["scene_interest"].take_update()
+            if scene_interest_updated and scene_interest_data:
+                person_in_current_scene = scene_interest_data.get("person_in_current_scene", False)
+                scenes_with_people = scene_interest_data.get("scenes_with_people", [])
+
+                if last_person_in_scene is not None and last_person_in_scene and not person_in_current_scene:
+                    # Transition to a random scene if the condition is met
+                    candidates = [scene for scene in scenes_with_people if scene not in moving_scenes]
+                    if len(candidates) > 0:
+                        next_scene = random.choice(candidates)
+                        print(f"Switching to random scene because current scene has no person in it: {next_scene}")
+                        await cut_now(next_scene, current_time)
+                        continue
+
+                last_person_in_scene = person_in_current_scene
+
+            # If the camera on program is a moving PTZ camera, switch to another scene
+            moving_scenes = signals["ptz_moving"].value or []
+            if next_preview_scene in moving_scenes:
+                next_preview_scene = None  # Pick another one below
+            if program_scene_name in moving_scenes:
+                next_preview_scene = pick_preview_scene(program_scene_name, scenes_with_people, moving_scenes)
+                # Nowhere to go if every other scene is a moving PTZ camera
+                if next_preview_scene != program_scene_name:
                     print(f"Switch from {program_scene_name} because PTZ is moving!")
-                    if len(scenes_with_people) > 0:
-                        if len(scenes_with_people) > 1:
-                            next_preview_scene = random.choice([scene for scene in scenes_with_people if scene != program_scene_name])
-                        elif scenes_with_people[0] != program_scene_name:
-                            next_preview_scene = scenes_with_people[0]
-                        else:
-                            next_preview_scene = program_scene_name
-                    else:
-                        next_preview_scene = random.choice([scene for scene in SCENE_LIST if scene != program_scene_name])
-
-                    await set_preview_scene(cl, next_preview_scene)
-                    await asyncio.sleep(0.1)
-                    await switch_preview_to_program(cl)
-                    if bpm < SLOW_BPM:
-                        next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min_slow"], config["obs"]["scenes"]["wait_max_slow"])
-                    else:
-                        next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min"], config["obs"]["scenes"]["wait_max"])
+                    await cut_now(next_preview_scene, current_time)
                     continue
 
-            # Fetch BPM data at the configured interval
+            # Use the latest BPM value
             # TODO: factor BPM into the random delay (switch scenes slower on slower songs)
-            if current_time - last_bpm_request_time >= config["bpm_api"]["poll_interval"]:
-                bpm = await get_bpm() or bpm
-                print(f"Current BPM: {bpm}")
-                last_bpm_request_time = current_time
-
-            # Calculate time per beat
-            seconds_per_beat = 60 / bpm
-            if bpm < SLOW_BPM:
-                next_switch_time = next_switch_time or current_time + random.uniform(config["obs"]["scenes"]["wait_min_slow"], config["obs"]["scenes"]["wait_max_slow"])
-            else:
-                next_switch_time = next_switch_time or current_time + random.uniform(config["obs"]["scenes"]["wait_min"], config["obs"]["scenes"]["wait_max"])
+            # Without music (speech, silence) the BPM is meaningless: cut at the slow rate and off-beat
+            bpm_updated, bpm_data = signals["bpm"].take_update()
+            if bpm_updated and bpm_data:
+                if bpm_data.get("music_playing", True) != music_playing:
+                    music_playing = bpm_data.get("music_playing", True)
+                    print("Music playing" if music_playing else "No music, ignoring BPM")
+                if music_playing:
+                    bpm = bpm_data.get("current_bpm") or bpm
+                    print(f"Current BPM: {bpm}")
+
+            if next_switch_time is None:
+                next_switch_time = schedule_next_switch(current_time, music_playing, bpm)
 
             # Pick and set a preview scene if none is set
             if next_preview_scene is None:
-                if len(scenes_with_people) > 0:
-                    if len(scenes_with_people) > 1:
-                        next_preview_scene = random.choice([scene for scene in scenes_with_people if scene != program_scene_name])
-                    elif scenes_with_people[0] != program_scene_name:
-                        next_preview_scene = scenes_with_people[0]
-                    else:
-                        next_preview_scene = program_scene_name
-                        
-                else:
-                    next_preview_scene = random.choice([scene for scene in SCENE_LIST if scene != program_scene_name])
+                next_preview_scene = pick_preview_scene(program_scene_name, scenes_with_people, moving_scenes)
 
                 await set_preview_scene(cl, next_preview_scene)
 
-            # Switch preview to program scene on beat
-            if current_time >= next_switch_time:
-                time_until_next_beat = seconds_per_beat - (current_time % seconds_per_beat)
-                print(f"Waiting {time_until_next_beat:.1}s for next beat...")
-                await asyncio.sleep(time_until_next_beat)  # Align with the beat
-                await switch_preview_to_program(cl)
-        
-                next_preview_scene = None  # Reset for the next switch
-                if bpm < SLOW_BPM:
-                    next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min_slow"], config["obs"]["scenes"]["wait_max_slow"])
+            # Once the timed cut is due, aim it at the next beat
+            if cut_time is None and current_time >= next_switch_time:
+                realigned = False
+                if next_preview_scene in scenes_with_people:
+                    # scenes_with_people can be seconds old, so have the preview scene re-checked
+                    # during the beat wait; the answer wakes the loop up
+                    preview_check = asyncio.create_task(signals["scene_interest"].check(scene=next_preview_scene))
+                    preview_check.add_done_callback(lambda _: signal_changed.set())
+                    # Without music there is no beat to wait for, so give the check until its timeout
+                    cut_time = beat_aligned(current_time) if music_playing else current_time + PREVIEW_CHECK_WAIT
                 else:
-                    next_switch_time = current_time + random.uniform(config["obs"]["scenes"]["wait_min"], config["obs"]["scenes"]["wait_max"])
+                    cut_time = beat_aligned(current_time)
+
+            if preview_check is not None and preview_check.done():
+                check = preview_check.result()
+                preview_check = None
+                if check is not None and check.get("scene") == next_preview_scene and check.get("person") is False:
+                    scenes_with_people = [scene for scene in scenes_with_people if scene != next_preview_scene]
+                    replacement = pick_preview_scene(program_scene_name, scenes_with_people, moving_scenes)
+                    if replacement not in (next_preview_scene, program_scene_name):
+                        print(f"{next_preview_scene} is empty now, cutting to {replacement} instead")
+                        next_preview_scene = replacement
+                        await set_preview_scene(cl, next_preview_scene)
+                        cut_time = beat_aligned(time.time())
+                if not music_playing and cut_time is not None:
+                    cut_time = min(cut_time, time.time())
+
+            # Switch preview to program scene on beat
+            if cut_time is not None and time.time() >= cut_time - CUT_TOLERANCE:
+                if preview_check is not None and music_playing and not realigned:
+                    # The check hasn't answered by this beat; give it until the next one
+                    realigned = True
+                    cut_time = beat_aligned(time.time() + CUT_TOLERANCE)
+                    continue
+                if preview_check is not None:
+                    preview_check.cancel()
+                    preview_check = None
+                CUT_LATENESS.observe(max(0.0, time.time() - cut_time))
+                await switch_preview_to_program(cl, obs_state)
 
-            await asyncio.sleep(0.1)  # Prevent busy-waiting
+                cut_time = None
+                next_preview_scene = None  # Reset for the next switch
+                next_switch_time = schedule_next_switch(current_time, music_playing, bpm)
 
     finally:
-        await cl.disconnect()  # Make sure to disconnect the client when done
+        lag_monitor.cancel()
+        cancel_timed_cut()
+        await metrics_runner.cleanup()
+        for signal in signals.values():
+            await signal.close()
+        await session.close()
+        if owns_obs:
+            events.disconnect()
+            cl.disconnect()  # Make sure to disconnect the clients when done
+        if recorder is not None:
+            recorder.close()
 
 # --- Main Entrypoint ---
 
@@ -0,0 +1,90 @@
+import time
+from common import metrics
+
+COMMAND_LATENCY = metrics.gauge("obs_transition_latency_seconds", "Smoothed time from sending a transition to OBS starting it")
+
+
+class ObsStateMirror:
+    """
+    Local mirror of the OBS program/preview scenes, kept up to date from the
+    OBS event stream instead of being polled.
+
+    obsws_python delivers events on its own thread, so every update is handed
+    over to the asyncio loop with `call_soon_threadsafe` before it touches the
+    mirror. `wakeup` (an asyncio.Event) is set on every change, and
+    `on_change(attribute, value)` is called with it if given.
+    """
+
+    # Give up waiting for SceneTransitionEnded after this long
+    TRANSITION_TIMEOUT = 5
+    # Weight of each new sample in the command latency average
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, req_client, event_client, loop, wakeup=None, on_change=None):
+        self.loop = loop
+        self.wakeup = wakeup
+        self.on_change = on_change
+
+        # Seed the mirror once; from here on OBS tells us about every change
+        self.program_scene = req_client.get_current_program_scene().current_program_scene_name
+        try:
+            self.preview_scene = req_client.get_current_preview_scene().current_preview_scene_name
+        except Exception:
+            # Studio mode is off, so there is no preview scene yet
+            self.preview_scene = None
+        self.transition_started_time = None
+        self.last_transition_end_time = None
+        # Seconds from sending a transition command to OBS starting the transition
+        self.command_latency = 0.05
+        self._command_sent_time = None
+
+        event_client.callback.register([
+            self.on_current_program_scene_changed,
+            self.on_current_preview_scene_changed,
+            self.on_scene_transition_started,
+            self.on_scene_transition_ended,
+        ])
+
+    def expect_transition(self, sent_time):
+        """Note that a transition command was just sent, to measure how long OBS takes to act on it."""
+        self._command_sent_time = sent_time
+
+    @property
+    def transitioning(self):
+        if self.transition_started_time is None:
+            return False
+        return time.time() - self.transition_started_time < self.TRANSITION_TIMEOUT
+
+    # --- OBS event callbacks (called on the obsws_python event thread) ---
+
+    def on_current_program_scene_changed(self, data):
+        self.loop.call_soon_threadsafe(self._update, "program_scene", data.scene_name)
+
+    def on_current_preview_scene_changed(self, data):
+        self.loop.call_soon_threadsafe(self._update, "preview_scene", data.scene_name)
+
+    def on_scene_transition_started(self, data):
+        self.loop.call_soon_threadsafe(self._transition_started, time.time())
+
+    def on_scene_transition_ended(self, data):
+        self.loop.call_soon_threadsafe(self._transition_ended, time.time())
+
+    def _update(self, attribute, value):
+        setattr(self, attribute, value)
+        if self.on_change is not None:
+            self.on_change(attribute, value)
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def _transition_started(self, start_time):
+        if self._command_sent_time is not None:
+            sample = start_time - self._command_sent_time
+            if 0 <= sample < self.TRANSITION_TIMEOUT:
+                self.command_latency += self.LATENCY_SMOOTHING * (sample - self.command_latency)
+                COMMAND_LATENCY.set(self.command_latency)
+            self._command_sent_time = None
+        self._update("transition_started_time", start_time)
+
+    def _transition_ended(self, end_time):
+        self.transition_started_time = None
+        self._update("last_transition_end_time", end_time)
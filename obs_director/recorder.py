@@ -0,0 +1,40 @@
+import json
+import os
+import time
+
+
+class Recorder:
+    """
+    Appends timestamped director inputs and outputs to a JSONL file, for
+    offline replay with `tools/replay.py`.
+
+    Every line is a JSON object with the wall-clock time `t` and a `type`:
+    `start` (config and initial OBS state), `signal` (raw payload received
+    from a detector API, keyed by its config section), `obs` (a change of
+    the mirrored OBS state) or `command` (a request sent to OBS).
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Line buffered, so a crash loses at most the line being written
+        self.file = open(path, "a", buffering=1)
+        self.path = path
+
+    def record(self, record_type, **fields):
+        self.file.write(json.dumps({"t": time.time(), "type": record_type, **fields}) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+def open_recorder(config):
+    """Create a Recorder if `recording.enabled` is set in config.json, else None."""
+    settings = config.get("recording", {})
+    if not settings.get("enabled"):
+        return None
+    name = time.strftime("director-%Y%m%d-%H%M%S.jsonl")
+    recorder = Recorder(os.path.join(settings.get("directory", "../recordings"), name))
+    print(f"Recording director session to {recorder.path}")
+    return recorder
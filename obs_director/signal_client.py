@@ -0,0 +1,385 @@
+import asyncio
+import json
+import time
+from urllib.parse import urljoin
+import aiohttp
+from common import metrics
+
+FETCH_SECONDS = metrics.histogram("signal_fetch_seconds", "One poll request to a detector service")
+FETCH_FAILURES = metrics.counter("signal_fetch_failures_total", "Failed poll requests to a detector service")
+SIGNAL_UPDATES = metrics.counter("signal_updates_total", "Values received from a detector service")
+CHECK_SECONDS = metrics.histogram("signal_check_seconds", "One on-demand check request to a detector service")
+
+
+class SignalClient:
+    """
+    Keeps the latest value of one detector service for the director.
+
+    If the service offers a push stream (`stream_url`, Server-Sent Events),
+    the client subscribes to it and updates the value the moment a change
+    arrives. While the stream is down it falls back to polling `url`.
+
+    Polling runs on the client's own task, which sleeps until the next
+    request is due, so the director never ticks to drive it and keeps
+    reading `value` (the last good result) while a request is in flight.
+    Nothing is polled while the stream is up. After `failure_threshold` consecutive
+    failures the circuit opens and the service is left alone for
+    `reset_timeout` seconds before a single trial request is let through.
+
+    With a `ready_url`, nothing is fetched until that endpoint answers 200,
+    so the defaults a service reports while it is still loading are never
+    acted on. A 404 counts as ready too, for services without the endpoint.
+
+    Services that can recompute their value on demand take a POST to
+    `check_url`; see `check()`.
+    """
+
+    def __init__(self, session, name, url, poll_interval, extract=None, timeout=0.5,
+                 failure_threshold=3, reset_timeout=10, stream_url=None, wakeup=None, on_data=None,
+                 ready_url=None, ready_interval=0.5, check_url=None, check_timeout=1.0):
+        self.session = session
+        self.name = name
+        self.url = url
+        self.poll_interval = poll_interval
+        self.extract = extract
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.stream_url = stream_url
+        self.wakeup = wakeup
+        self.on_data = on_data  # Called with every raw payload received, e.g. for recording
+        self.ready_url = ready_url
+        self.ready_interval = ready_interval
+        self.check_url = check_url
+        self.check_timeout = aiohttp.ClientTimeout(total=check_timeout)
+
+        self.ready = ready_url is None
+        self.ready_event = asyncio.Event()
+        if self.ready:
+            self.ready_event.set()
+        self.value = None
+        self.last_success_time = 0
+        self.streaming = False
+        self._fresh = False
+        self._poll_task = None
+        self._stream_task = None
+        self._ready_task = None
+        self._last_request_time = 0
+        self._failures = 0
+        self._open_until = 0
+
+    def circuit_open(self, now=None):
+        return (now or time.time()) < self._open_until
+
+    def start(self):
+        """Wait for the service to be ready, then subscribe to its push stream (if it has one) and poll while that's down."""
+        if not self.ready and self._ready_task is None:
+            self._ready_task = asyncio.create_task(self._wait_until_ready())
+        if self.stream_url and self._stream_task is None:
+            self._stream_task = asyncio.create_task(self._stream_loop())
+        if self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        await self.ready_event.wait()
+        while True:
+            now = time.time()
+            if not self.streaming and not self.circuit_open(now):
+                self._last_request_time = now
+                await self._fetch()
+            # Sleep until the next request is due, or until the circuit lets a trial request through
+            due = max(self._last_request_time + self.poll_interval, self._open_until)
+            await asyncio.sleep(max(0.0, due - time.time()))
+
+    def take_update(self):
+        """Return (True, value) once for every newly received value, else (False, value)."""
+        fresh = self._fresh
+        self._fresh = False
+        return fresh, self.value
+
+    async def check(self, **params):
+        """
+        Ask the service to check something now (e.g. scene=...), ahead of its
+        own schedule. Returns the JSON answer, or None if the service has no
+        check endpoint, isn't ready, or doesn't answer within `check_timeout`.
+        """
+        if self.check_url is None or not self.ready or self.circuit_open():
+            return None
+        start = time.perf_counter()
+        try:
+            async with self.session.post(self.check_url, params=params, timeout=self.check_timeout) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                return await response.json()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = f"timed out after {self.check_timeout.total}s"
+            print(f"Error checking {self.name} {params}: {e}")
+            return None
+        finally:
+            CHECK_SECONDS.observe(time.perf_counter() - start, signal=self.name)
+
+    def _set_value(self, value):
+        self.value = value
+        self.last_success_time = time.time()
+        self._fresh = True
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _fetch(self):
+        start = time.perf_counter()
+        try:
+            async with self.session.get(self.url, timeout=self.timeout) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                data = await response.json()
+            value = self.extract(data) if self.extract else data
+        except Exception as e:
+            self._record_failure(e)
+            return
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - start, signal=self.name)
+
+        if self._failures >= self.failure_threshold:
+            print(f"{self.name} service recovered, closing circuit")
+        self._failures = 0
+        if self.on_data is not None:
+            self.on_data(data)
+        SIGNAL_UPDATES.inc(signal=self.name, source="poll")
+        self._set_value(value)
+
+    async def _wait_until_ready(self):
+        stage = None
+        while True:
+            try:
+                async with self.session.get(self.ready_url, timeout=self.timeout) as response:
+                    if response.status in (200, 404):
+                        break
+                    # 503 while starting up, with the stage it's in
+                    data = await response.json()
+                if data.get("stage") != stage:
+                    stage = data.get("stage")
+                    print(f"Waiting for {self.name} service: {stage}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Not listening yet
+                pass
+            await asyncio.sleep(self.ready_interval)
+
+        print(f"{self.name} service is ready")
+        self.ready = True
+        self.ready_event.set()
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _stream_loop(self):
+        # Services send a keep-alive at least every 15 s, so a silent socket means a dead stream
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout.total, sock_read=35)
+        await self.ready_event.wait()
+        backoff = 1
+        while True:
+            try:
+                async with self.session.get(self.stream_url, timeout=timeout) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"HTTP {response.status}")
+                    print(f"Subscribed to {self.name} stream")
+                    backoff = 1
+                    async for line in response.content:
+                        if not line.startswith(b"data:"):
+                            continue
+                        data = json.loads(line[5:])
+                        self.streaming = True
+                        self._failures = 0
+                        self._open_until = 0
+                        if self.on_data is not None:
+                            self.on_data(data)
+                        SIGNAL_UPDATES.inc(signal=self.name, source="stream")
+                        self._set_value(self.extract(data) if self.extract else data)
+                print(f"{self.name} stream closed, falling back to polling")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.streaming:
+                    print(f"{self.name} stream dropped ({e}), falling back to polling")
+            finally:
+                self.streaming = False
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _record_failure(self, error):
+        self._failures += 1
+        FETCH_FAILURES.inc(signal=self.name)
+        if isinstance(error, asyncio.TimeoutError):
+            error = f"timed out after {self.timeout.total}s"
+        print(f"Error fetching {self.name} data: {error}")
+        if self._failures >= self.failure_threshold:
+            self._open_until = time.time() + self.reset_timeout
+            print(f"{self.name} service failed {self._failures} times in a row, "
+                  f"pausing requests for {self.reset_timeout}s")
+
+    async def close(self):
+        for task in (self._poll_task, self._stream_task, self._ready_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+
+class LocalSignal:
+    """
+    Stand-in for a SignalClient when the detector runs in the same process
+    (the all-in-one runtime): it subscribes to the detector's
+    StateBroadcaster, so every change arrives without an HTTP hop.
+
+    Detectors publish from their own threads, so each value is handed over
+    to the asyncio loop with `call_soon_threadsafe` before it is stored.
+    With a `readiness`, values are ignored until the detector is ready.
+    `check_function` is the detector's on-demand check, run on a thread.
+    """
+
+    def __init__(self, name, broadcaster, loop, extract=None, wakeup=None, on_data=None, readiness=None,
+                 check_function=None):
+        self.name = name
+        self.broadcaster = broadcaster
+        self.loop = loop
+        self.extract = extract
+        self.wakeup = wakeup
+        self.on_data = on_data
+        self.check_function = check_function
+
+        self.value = None
+        self.last_success_time = 0
+        self.streaming = True
+        self.ready = readiness is None or readiness.ready
+        self.ready_event = asyncio.Event()
+        self._fresh = False
+        broadcaster.subscribe(self._on_publish)
+        if self.ready:
+            self.ready_event.set()
+            if broadcaster.state is not None:
+                self._receive(broadcaster.state)
+        else:
+            readiness.on_ready(lambda: loop.call_soon_threadsafe(self._became_ready))
+
+    def start(self):
+        # Every change is pushed; there is nothing to fetch
+        pass
+
+    def take_update(self):
+        """Return (True, value) once for every newly received value, else (False, value)."""
+        fresh = self._fresh
+        self._fresh = False
+        return fresh, self.value
+
+    async def check(self, **params):
+        """Run the detector's check now; None if it has none or isn't ready."""
+        if self.check_function is None or not self.ready:
+            return None
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(self.check_function, **params)
+        except Exception as e:
+            print(f"Error checking {self.name} {params}: {e}")
+            return None
+        finally:
+            CHECK_SECONDS.observe(time.perf_counter() - start, signal=self.name)
+
+    def _on_publish(self, state):
+        self.loop.call_soon_threadsafe(self._receive, state)
+
+    def _became_ready(self):
+        print(f"{self.name} is ready")
+        self.ready = True
+        self.ready_event.set()
+        if self.broadcaster.state is not None:
+            self._receive(self.broadcaster.state)
+
+    def _receive(self, data):
+        if not self.ready:
+            return
+        if self.on_data is not None:
+            self.on_data(data)
+        SIGNAL_UPDATES.inc(signal=self.name, source="local")
+        self.value = self.extract(data) if self.extract else data
+        self.last_success_time = time.time()
+        self._fresh = True
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def close(self):
+        self.broadcaster.unsubscribe(self._on_publish)
+
+
+def create_signal_clients(session, config, wakeup=None, recorder=None, local=None):
+    """
+    Build one SignalClient per detector service configured in config.json.
+    `wakeup` is set whenever any of them receives a new value, and every
+    payload is logged to `recorder` if one is given.
+
+    `local` maps signal names to the (StateBroadcaster, Readiness) of a
+    detector running in this process, plus its check function if it has
+    one; those signals are read in memory (LocalSignal) instead.
+    """
+    breaker = config.get("signal_client", {})
+    ptz_scene = config["obs"]["scenes"]["ptz_scene"]
+    local = local or {}
+
+    def client(signal, name, key, extract, check_path=None):
+        on_data = (lambda data: recorder.record("signal", key=key, data=data)) if recorder else None
+        if signal in local:
+            broadcaster, readiness, *check_function = local[signal]
+            check_function = check_function[0] if check_function else None
+            return LocalSignal(name, broadcaster, asyncio.get_running_loop(), extract=extract, wakeup=wakeup,
+                               on_data=on_data, readiness=readiness, check_function=check_function)
+        api = config[key]
+        return SignalClient(
+            session,
+            name,
+            api["url"],
+            api["poll_interval"],
+            extract=extract,
+            timeout=api.get("timeout", breaker.get("timeout", 0.5)),
+            failure_threshold=breaker.get("failure_threshold", 3),
+            reset_timeout=breaker.get("reset_timeout", 10),
+            stream_url=api.get("stream_url"),
+            wakeup=wakeup,
+            on_data=on_data,
+            # Every service answers /ready on its own port; null skips the check
+            ready_url=api.get("ready_url", urljoin(api["url"], "/ready")),
+            check_url=api.get("check_url", urljoin(api["url"], check_path)) if check_path else None,
+            check_timeout=api.get("check_timeout", 1.0),
+        )
+
+    signals = {
+        # Scenes can be re-checked on demand before a cut
+        "scene_interest": client("scene_interest", "scene interest", "scene_interest_api", None, check_path="/check"),
+        "bpm": client("bpm", "BPM", "bpm_api", None),
+        # Older PTZ services only report whether the single PTZ scene is moving
+        "ptz_moving": client("ptz_moving", "PTZ moving", "ptz_moving_api",
+                             lambda data: data.get("moving_scenes", [ptz_scene] if data["moving"] else [])),
+        "lyrics": client("lyrics", "lyrics", "lyrics_api", lambda data: data["lyrics_shown"]),
+    }
+    # The beat grid is optional; without it cuts fall back to BPM-only timing
+    if "beat_api" in config or "beats" in local:
+        signals["beats"] = client("beats", "beat grid", "beat_api", None)
+    return signals
+
+
+async def wait_until_ready(signals, timeout):
+    """
+    Wait until every signal's service is ready, or `timeout` seconds have
+    passed. Returns the names of the services that still aren't.
+    """
+    pending = [signal.ready_event.wait() for signal in signals.values() if not signal.ready]
+    if pending:
+        try:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout)
+        except asyncio.TimeoutError:
+            pass
+    return [signal.name for signal in signals.values() if not signal.ready]
@@ -1,50 +1,178 @@
+import os
+import sys
+import json
+import time
 import asyncio
 from aiohttp import web  # Make sure aiohttp is installed
 
-ptzCameraMoving = False
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics
+from common.events import StateBroadcaster, aiohttp_sse_stream
+from common.readiness import Readiness
+from ptz_moving.state import PtzStateStore
+
+config = None
+with open("../config.json", "r") as file:
+    config = json.load(file)
+
+PTZ_CONFIG = config.get("ptz_moving", {})
+# Scene marked as moving by a plain POST / (the single PTZ camera of older setups)
+DEFAULT_SCENE = PTZ_CONFIG.get("default_scene", config["obs"]["scenes"]["ptz_scene"])
+MOVE_DURATION = PTZ_CONFIG.get("move_duration", 5)
+MAX_LONG_POLL = 60  # seconds
+
+# Moving state of every PTZ camera, keyed by the scene that shows it
+ptz_state = PtzStateStore(PTZ_CONFIG.get("scenes", [DEFAULT_SCENE]), move_duration=MOVE_DURATION)
+
+# Pushes every change of the moving cameras to subscribers of /events
+ptz_broadcaster = StateBroadcaster(ptz_state.state())
+
+# Created on the event loop in start_web_server: wakes the expiry timer / long-polls
+deadline_changed = None
+state_changed = None
+expiry_timer = None
+
+# The state is known from the start, so the service is ready as soon as it listens
+readiness = Readiness("ptz_moving")
+
+PTZ_MOVES = metrics.counter("ptz_moves_total", "PTZ movement notifications received")
+PTZ_GAUGE = metrics.gauge("ptz_cameras_moving", "Number of PTZ cameras currently moving")
 
 # --- Web Server Section ---
 
+def publish_state():
+    """Push the moving cameras to stream subscribers and wake any long-polls."""
+    global state_changed
+    state = ptz_state.state()
+    PTZ_GAUGE.set(len(state["moving_scenes"]))
+    ptz_broadcaster.publish(state)
+    # Waiters hold on to the old event; the next change gets a fresh one
+    state_changed.set()
+    state_changed = asyncio.Event()
+
 async def handle_ptz_post(request):
     """
-    HTTP POST handler for the root URL. Sets the ptzCameraMoving flag to True,
-    then schedules a reset after 5 seconds.
+    HTTP POST handler for the root URL and /cameras/{scene}. Marks a camera as
+    moving for MOVE_DURATION seconds (or ?duration=), extending a move in
+    progress. The root URL marks DEFAULT_SCENE unless ?scene= is given.
     """
-    global ptzCameraMoving
-    ptzCameraMoving = True
-    print("Received POST request at '/': ptzCameraMoving set to True")
-    # Schedule the flag to be reset after 5 seconds
-    asyncio.create_task(reset_ptz_after_delay())
+    scene = request.match_info.get("scene") or request.query.get("scene", DEFAULT_SCENE)
+    try:
+        duration = float(request.query["duration"]) if "duration" in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest(text="duration must be a number of seconds")
+    PTZ_MOVES.inc(scene=scene)
+    if ptz_state.mark_moving(scene, duration):
+        print(f"Received POST request: {scene} is moving")
+        publish_state()
+    # Only the deadline moved (or a new one was added); let the timer re-arm
+    deadline_changed.set()
     return web.Response(text="PTZ Camera movement started")
 
+async def handle_ptz_delete(request):
+    """
+    HTTP DELETE handler for /cameras/{scene}. Ends a camera's move early.
+    """
+    scene = request.match_info["scene"]
+    if ptz_state.mark_stopped(scene):
+        print(f"Received DELETE request: {scene} stopped moving")
+        publish_state()
+    return web.Response(text="PTZ Camera movement stopped")
+
 async def handle_ptz_get(request):
     """
-    HTTP GET handler for the root URL. Returns the current value of ptzCameraMoving.
+    HTTP GET handler for the root URL. Returns the bulk status of every camera.
+    With ?since=<version> it long-polls: the response is held until the state
+    is newer than that version, or ?timeout= seconds (default 30) pass.
     """
-    global ptzCameraMoving
-    # Return the current value as JSON
-    return web.json_response({"moving": ptzCameraMoving})
+    if "since" in request.query:
+        try:
+            since = int(request.query["since"])
+            timeout = min(float(request.query.get("timeout", 30)), MAX_LONG_POLL)
+        except ValueError:
+            raise web.HTTPBadRequest(text="since must be an integer and timeout a number of seconds")
+        if ptz_state.version <= since:
+            try:
+                await asyncio.wait_for(state_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    return web.json_response(ptz_state.status())
 
-async def reset_ptz_after_delay():
-    """Waits 5 seconds and then resets ptzCameraMoving to False."""
-    global ptzCameraMoving
-    await asyncio.sleep(5)
-    ptzCameraMoving = False
-    print("5 seconds elapsed: ptzCameraMoving reset to False")
+async def handle_ptz_events(request):
+    """
+    HTTP GET handler for /events. Streams the moving cameras and every later
+    change as Server-Sent Events.
+    """
+    return await aiohttp_sse_stream(request, ptz_broadcaster)
+
+async def handle_metrics(request):
+    """
+    HTTP GET handler for /metrics. Returns Prometheus metrics.
+    """
+    return web.Response(body=metrics.REGISTRY.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+async def handle_ready(request):
+    """
+    HTTP GET handler for /ready. 200 once the server is up.
+    """
+    status = readiness.status()
+    return web.json_response(status, status=200 if status["ready"] else 503)
+
+async def expire_moves():
+    """
+    The only timer: sleeps until the earliest move deadline (or until a POST
+    changes the deadlines), then publishes the cameras that stopped moving.
+    """
+    while True:
+        deadline = ptz_state.next_deadline()
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            await asyncio.wait_for(deadline_changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        deadline_changed.clear()
+        expired = ptz_state.expire()
+        if expired:
+            print(f"{', '.join(expired)} stopped moving")
+            publish_state()
+
+async def start(port=16842):
+    """
+    Starts the aiohttp web server and the expiry timer on the running loop.
+    Returns the AppRunner; the all-in-one runtime calls this on its own loop.
+    """
+    global deadline_changed, state_changed, expiry_timer
+    deadline_changed = asyncio.Event()
+    state_changed = asyncio.Event()
 
-async def start_web_server():
-    """Starts the aiohttp web server on port 16842."""
     app = web.Application()
-    # Add POST route for triggering the PTZ camera movement.
+    # Add POST routes for triggering a PTZ camera movement.
     app.router.add_post('/', handle_ptz_post)
-    # Add GET route for retrieving the current state of ptzCameraMoving.
+    app.router.add_post('/cameras/{scene}', handle_ptz_post)
+    # Add DELETE route for ending a movement early.
+    app.router.add_delete('/cameras/{scene}', handle_ptz_delete)
+    # Add GET route for retrieving (or long-polling) the state of every camera.
     app.router.add_get('/', handle_ptz_get)
+    # Add GET route for streaming changes of the moving cameras.
+    app.router.add_get('/events', handle_ptz_events)
+    # Add GET route for Prometheus metrics.
+    app.router.add_get('/metrics', handle_metrics)
+    # Add GET route for the startup state.
+    app.router.add_get('/ready', handle_ready)
     
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 16842)
+    site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
-    print("Web server running on port 16842")
+    print(f"Web server running on port {port}")
+    expiry_timer = asyncio.create_task(expire_moves())
+    readiness.set_ready()
+    return runner
+
+async def start_web_server():
+    """Starts the aiohttp web server on port 16842."""
+    await start()
+    lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
     # Keep the server running forever.
     while True:
         await asyncio.sleep(3600)
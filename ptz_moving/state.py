@@ -0,0 +1,73 @@
+import time
+
+
+class PtzStateStore:
+    """
+    Moving/idle state of every PTZ camera, keyed by the OBS scene that shows it.
+
+    A move notification only stores a deadline (`now + duration`), so a
+    camera is moving while its deadline lies in the future: updates and
+    reads are a dict write or lookup and a comparison, and repeated
+    notifications simply overwrite the deadline. A single timer sleeps
+    until `next_deadline()`, the earliest deadline (a min() over the handful
+    of cameras), and calls `expire()` to publish the change.
+    """
+
+    def __init__(self, cameras=(), move_duration=5.0):
+        self.move_duration = move_duration
+        self.version = 0  # Bumped on every change of any camera's moving state
+        self.cameras = set(cameras)  # Every camera known so far, for bulk status
+        self._deadlines = {}
+
+    def is_moving(self, camera, now=None):
+        return self._deadlines.get(camera, 0) > (now or time.time())
+
+    def mark_moving(self, camera, duration=None, now=None):
+        """Mark a camera as moving for `duration` seconds from now. Returns True if it wasn't moving yet."""
+        now = now or time.time()
+        started = not self.is_moving(camera, now)
+        deadline = now + (self.move_duration if duration is None else duration)
+        self.cameras.add(camera)
+        self._deadlines[camera] = deadline
+        if started:
+            self.version += 1
+        return started
+
+    def mark_stopped(self, camera, now=None):
+        """Clear a camera's move before its deadline. Returns True if it was moving."""
+        stopped = self.is_moving(camera, now)
+        self._deadlines.pop(camera, None)
+        if stopped:
+            self.version += 1
+        return stopped
+
+    def next_deadline(self):
+        """Earliest pending deadline, or None if no camera is moving."""
+        return min(self._deadlines.values(), default=None)
+
+    def expire(self, now=None):
+        """Drop every camera whose deadline has passed. Returns the cameras that stopped moving."""
+        now = now or time.time()
+        expired = sorted(camera for camera, deadline in self._deadlines.items() if deadline <= now)
+        for camera in expired:
+            del self._deadlines[camera]
+        if expired:
+            self.version += 1
+        return expired
+
+    def moving_cameras(self, now=None):
+        now = now or time.time()
+        return sorted(camera for camera, deadline in self._deadlines.items() if deadline > now)
+
+    def state(self, now=None):
+        """Which cameras are moving; only changes when `version` does."""
+        moving = self.moving_cameras(now)
+        return {"moving": bool(moving), "moving_scenes": moving, "version": self.version}
+
+    def status(self, now=None):
+        """Bulk status: the state plus the seconds left on every known camera's move (0 when idle)."""
+        now = now or time.time()
+        return {
+            **self.state(now),
+            "cameras": {camera: round(max(0.0, self._deadlines.get(camera, 0) - now), 3) for camera in sorted(self.cameras)},
+        }
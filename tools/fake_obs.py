@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import base64
+import json
+import time
+import zlib
+import cv2
+import numpy as np
+from aiohttp import web, WSMsgType
+
+# obs-websocket v5 opcodes
+OP_HELLO = 0
+OP_IDENTIFY = 1
+OP_IDENTIFIED = 2
+OP_REIDENTIFY = 3
+OP_EVENT = 5
+OP_REQUEST = 6
+OP_REQUEST_RESPONSE = 7
+
+# Event subscription bits
+SUB_SCENES = 1 << 2
+SUB_TRANSITIONS = 1 << 4
+
+# Request status codes
+STATUS_SUCCESS = 100
+STATUS_UNKNOWN_REQUEST = 204
+STATUS_RESOURCE_NOT_FOUND = 600
+
+
+def test_pattern(scene_name, width=1280, height=720):
+    """A flat colour per scene with its name on it; the default screenshot source."""
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = [(zlib.crc32(scene_name.encode()) >> shift) & 0xFF for shift in (0, 8, 16)]
+    cv2.putText(frame, scene_name, (40, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+    return frame
+
+
+class FakeObs:
+    """
+    Stand-in for the OBS WebSocket server (protocol v5), covering the
+    requests and events the director and the detector services use.
+
+    Studio mode is always on. A transition starts immediately and ends
+    `transition_duration` seconds later, with the same events OBS sends.
+    Screenshots come from `frame_source(scene_name)`, a BGR frame of any size.
+    Every command that changes state is appended to `commands` as
+    `(time, request_type, request_data)` and passed to `on_command`.
+    Authentication is not supported, so clients must connect without a password.
+    """
+
+    def __init__(self, scenes, program_scene=None, preview_scene=None, transition_duration=0.3,
+                 frame_source=test_pattern, on_command=None):
+        self.scenes = list(scenes)
+        self.program_scene = program_scene or self.scenes[0]
+        self.preview_scene = preview_scene or self.program_scene
+        self.transition_duration = transition_duration
+        self.frame_source = frame_source
+        self.on_command = on_command
+
+        self.commands = []
+        self.program_history = [(time.time(), self.program_scene)]
+        self.clients = {}  # WebSocketResponse -> event subscriptions
+        self.identified = asyncio.Event()
+        self._runner = None
+        self._transition_task = None
+
+    async def start(self, host="127.0.0.1", port=4455):
+        app = web.Application()
+        app.router.add_get("/", self._handle_connection)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        print(f"Fake OBS listening on ws://{host}:{port}")
+
+    async def stop(self):
+        for ws in list(self.clients):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def set_program_scene(self, scene_name):
+        """Cut to a scene as an operator would in the OBS UI (not logged as a command)."""
+        self._set_program(scene_name)
+
+    # --- Protocol ---
+
+    async def _handle_connection(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"op": OP_HELLO, "d": {"obsWebSocketVersion": "5.0.0", "rpcVersion": 1}})
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(message.data)
+                op, data = payload["op"], payload.get("d", {})
+                if op in (OP_IDENTIFY, OP_REIDENTIFY):
+                    self.clients[ws] = data.get("eventSubscriptions", 0)
+                    await ws.send_json({"op": OP_IDENTIFIED, "d": {"negotiatedRpcVersion": 1}})
+                    if self.clients[ws]:
+                        self.identified.set()
+                elif op == OP_REQUEST:
+                    status, response_data = self._request(data["requestType"], data.get("requestData") or {})
+                    response = {"requestType": data["requestType"], "requestId": data.get("requestId"), "requestStatus": status}
+                    if response_data is not None:
+                        response["responseData"] = response_data
+                    await ws.send_json({"op": OP_REQUEST_RESPONSE, "d": response})
+        finally:
+            self.clients.pop(ws, None)
+        return ws
+
+    def _emit(self, event_type, intent, event_data):
+        message = json.dumps({"op": OP_EVENT, "d": {"eventType": event_type, "eventIntent": intent, "eventData": event_data}})
+        for ws, subscriptions in list(self.clients.items()):
+            if subscriptions & intent and not ws.closed:
+                asyncio.ensure_future(ws.send_str(message))
+
+    def _request(self, request_type, data):
+        """Handle one request; returns (requestStatus, responseData)."""
+        ok = {"result": True, "code": STATUS_SUCCESS}
+
+        if request_type == "GetVersion":
+            return ok, {"obsVersion": "30.0.0", "obsWebSocketVersion": "5.0.0", "rpcVersion": 1}
+        if request_type == "GetSceneList":
+            return ok, {
+                "currentProgramSceneName": self.program_scene,
+                "currentPreviewSceneName": self.preview_scene,
+                "scenes": [{"sceneName": scene, "sceneIndex": index} for index, scene in enumerate(reversed(self.scenes))],
+            }
+        if request_type == "GetCurrentProgramScene":
+            return ok, {"currentProgramSceneName": self.program_scene, "sceneName": self.program_scene}
+        if request_type == "GetCurrentPreviewScene":
+            return ok, {"currentPreviewSceneName": self.preview_scene, "sceneName": self.preview_scene}
+        if request_type == "GetSourceScreenshot":
+            return self._screenshot(data)
+
+        if request_type in ("SetCurrentPreviewScene", "SetCurrentProgramScene") and data.get("sceneName") not in self.scenes:
+            return {"result": False, "code": STATUS_RESOURCE_NOT_FOUND, "comment": "No source was found"}, None
+        if request_type == "SetCurrentPreviewScene":
+            self._command(request_type, data)
+            self.preview_scene = data["sceneName"]
+            self._emit("CurrentPreviewSceneChanged", SUB_SCENES, {"sceneName": self.preview_scene})
+            return ok, None
+        if request_type == "SetCurrentProgramScene":
+            self._command(request_type, data)
+            self._set_program(data["sceneName"])
+            return ok, None
+        if request_type == "TriggerStudioModeTransition":
+            self._command(request_type, data)
+            self._start_transition()
+            return ok, None
+
+        return {"result": False, "code": STATUS_UNKNOWN_REQUEST, "comment": f"Unknown request type: {request_type}"}, None
+
+    # --- State ---
+
+    def _command(self, request_type, data):
+        now = time.time()
+        self.commands.append((now, request_type, data))
+        if self.on_command is not None:
+            self.on_command(now, request_type, data)
+
+    def _set_program(self, scene_name):
+        self.program_scene = scene_name
+        self.program_history.append((time.time(), scene_name))
+        self._emit("CurrentProgramSceneChanged", SUB_SCENES, {"sceneName": scene_name})
+
+    def _start_transition(self):
+        # Like OBS, the program scene changes as the transition starts and the old one moves to preview
+        self._emit("SceneTransitionStarted", SUB_TRANSITIONS, {"transitionName": "Fade"})
+        old_program = self.program_scene
+        self._set_program(self.preview_scene)
+        self.preview_scene = old_program
+        self._emit("CurrentPreviewSceneChanged", SUB_SCENES, {"sceneName": self.preview_scene})
+        if self._transition_task is not None:
+            self._transition_task.cancel()
+        self._transition_task = asyncio.ensure_future(self._end_transition())
+
+    async def _end_transition(self):
+        await asyncio.sleep(self.transition_duration)
+        self._emit("SceneTransitionEnded", SUB_TRANSITIONS, {"transitionName": "Fade"})
+
+    def _screenshot(self, data):
+        scene_name = data.get("sourceName")
+        if scene_name not in self.scenes or self.frame_source is None:
+            return {"result": False, "code": STATUS_RESOURCE_NOT_FOUND, "comment": "No source was found"}, None
+        frame = self.frame_source(scene_name)
+        width, height = data.get("imageWidth"), data.get("imageHeight")
+        if width and height:
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        image_format = data.get("imageFormat", "png")
+        params = []
+        if image_format in ("jpg", "jpeg") and data.get("imageCompressionQuality", -1) >= 0:
+            params = [cv2.IMWRITE_JPEG_QUALITY, data["imageCompressionQuality"]]
+        encoded = cv2.imencode("." + image_format, frame, params)[1]
+        image_data = f"data:image/{image_format};base64," + base64.b64encode(encoded.tobytes()).decode()
+        return {"result": True, "code": STATUS_SUCCESS}, {"imageData": image_data}
+
+
+async def serve(scenes, host, port, transition_duration):
+    fake_obs = FakeObs(scenes, transition_duration=transition_duration,
+                       on_command=lambda now, request_type, data: print(f"{now:.3f} {request_type} {data}"))
+    await fake_obs.start(host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake_obs.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OBS WebSocket server that serves test-pattern scenes.")
+    parser.add_argument("scenes", nargs="+", help="Scene names")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4455)
+    parser.add_argument("--transition-duration", type=float, default=0.3)
+    args = parser.parse_args()
+    asyncio.run(serve(args.scenes, args.host, args.port, args.transition_duration))
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urljoin
+import cv2
+import numpy as np
+import aiohttp
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from tools.fake_obs import FakeObs, test_pattern
+from tools.stats import percentiles
+
+# Services started for the benchmark, with the API whose /ready answers once each is warmed up
+SERVICES = {
+    "ptz_moving": ("ptz_moving/server.py", "ptz_moving_api"),
+    "lyrics_shown": ("lyrics_shown/server.py", "lyrics_api"),
+    "interesting_scene": ("interesting_scene/server.py", "scene_interest_api"),
+    "obs_director": ("obs_director/app.py", None),
+}
+SCENARIOS = ("ptz", "lyrics", "person")
+TRIAL_TIMEOUT = 15  # Seconds to wait for a cut before counting a trial as missed
+
+
+class SyntheticScenes:
+    """
+    Frame source for the fake OBS. Camera scenes show their test pattern,
+    with `person_image` pasted in while the scene is in `occupied`. The
+    projector shows a static slide, or a new frame of noise on every
+    screenshot while `video` is set.
+    """
+
+    def __init__(self, projector_scene, person_image=None, width=1280, height=720):
+        self.projector_scene = projector_scene
+        self.size = (width, height)
+        self.occupied = set()
+        self.video = False
+        self._backgrounds = {}
+        self._person = None
+        if person_image is not None:
+            person = cv2.imread(person_image)
+            if person is None:
+                raise SystemExit(f"Can't read {person_image}")
+            scale = height * 0.8 / person.shape[0]
+            self._person = cv2.resize(person, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        self._slide = np.full((height, width, 3), 20, dtype=np.uint8)
+        cv2.putText(self._slide, "Amazing grace, how sweet the sound", (80, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+        self._noise = np.random.randint(0, 256, (height * 2, width * 2, 3), dtype=np.uint8)
+
+    def __call__(self, scene_name):
+        width, height = self.size
+        if scene_name == self.projector_scene:
+            if not self.video:
+                return self._slide
+            # A random window of a larger noise image is as different as a fresh one, and much cheaper
+            x, y = np.random.randint(0, width), np.random.randint(0, height)
+            return self._noise[y:y + height, x:x + width]
+
+        if scene_name not in self._backgrounds:
+            self._backgrounds[scene_name] = test_pattern(scene_name, width, height)
+        frame = self._backgrounds[scene_name]
+        if scene_name in self.occupied and self._person is not None:
+            frame = frame.copy()
+            person_height, person_width = self._person.shape[:2]
+            left = max(0, min(width - person_width, width // 3))
+            frame[height - person_height:, left:left + person_width] = self._person[:, :width - left]
+        return frame
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process, via psutil if installed, else /proc."""
+    try:
+        import psutil
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except ImportError:
+        with open(f"/proc/{pid}/stat") as file:
+            # Fields after the command name (which may contain spaces); utime and stime are fields 14 and 15
+            fields = file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_config(base_config, obs_port):
+    """The base config pointed at the fake OBS, with timed cuts pushed far out so only reactive cuts happen."""
+    config = json.loads(json.dumps(base_config))
+    config["obs"]["websocket"] = {"host": "127.0.0.1", "port": obs_port, "password": ""}
+    scenes = config["obs"]["scenes"]
+    for key in ("wait_min", "wait_max", "wait_min_slow", "wait_max_slow"):
+        scenes[key] = 3600
+    config["frame_capture"] = {"enabled": False}
+    config["recording"] = {"enabled": False}
+    config["metrics"] = {"director_port": 0}
+    # The BPM service isn't started. Its signal is required, so it is marked ready up front instead of
+    # holding up the director's readiness gate for the whole ready_timeout; it just keeps its default.
+    # The optional beat grid client would only add to the connection errors.
+    config["bpm_api"]["ready_url"] = None
+    config.pop("beat_api", None)
+    return config
+
+
+class Bench:
+    def __init__(self, args, config, fake_obs, scenes, session):
+        self.args = args
+        self.config = config
+        self.fake_obs = fake_obs
+        self.scenes = scenes
+        self.session = session
+        self.cuts = asyncio.Queue()
+        fake_obs.on_command = self._on_command
+
+    def _on_command(self, now, request_type, data):
+        if request_type == "TriggerStudioModeTransition":
+            self.cuts.put_nowait(now)
+
+    async def get_json(self, key):
+        try:
+            async with self.session.get(self.config[key]["url"], timeout=aiohttp.ClientTimeout(total=1)) as response:
+                return await response.json() if response.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def ready(self, key):
+        try:
+            ready_url = urljoin(self.config[key]["url"], "/ready")
+            async with self.session.get(ready_url, timeout=aiohttp.ClientTimeout(total=1)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def wait_until(self, check, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if await check():
+                return True
+            await asyncio.sleep(0.1)
+        return False
+
+    async def cut_after(self, start):
+        """Seconds from `start` to the next transition, or None if none comes in time."""
+        deadline = start + TRIAL_TIMEOUT
+        while True:
+            try:
+                cut_time = await asyncio.wait_for(self.cuts.get(), max(0.0, deadline - time.time()))
+            except asyncio.TimeoutError:
+                return None
+            if cut_time >= start:
+                return cut_time - start
+
+    async def prepare(self, program_scene, ready):
+        """Cut to a scene, wait until the services agree on the starting state, and flush stale cuts."""
+        self.fake_obs.set_program_scene(program_scene)
+        if not await self.wait_until(ready):
+            return False
+        await asyncio.sleep(self.args.settle)
+        while not self.cuts.empty():
+            self.cuts.get_nowait()
+        return True
+
+    async def trial_ptz(self):
+        ptz_scene = self.config["obs"]["scenes"]["ptz_scene"]
+        async def not_moving():
+            data = await self.get_json("ptz_moving_api")
+            return data is not None and not data["moving"]
+        if not await self.prepare(ptz_scene, not_moving):
+            return None
+        start = time.time()
+        async with self.session.post(self.config["ptz_moving_api"]["url"]):
+            pass
+        return await self.cut_after(start)
+
+    async def trial_lyrics(self):
+        scene = self.config["obs"]["scenes"]["list"][0]
+        self.scenes.video = False
+        async def lyrics_shown():
+            data = await self.get_json("lyrics_api")
+            return data is not None and data["lyrics_shown"]
+        if not await self.prepare(scene, lyrics_shown):
+            return None
+        start = time.time()
+        self.scenes.video = True
+        latency = await self.cut_after(start)
+        self.scenes.video = False
+        return latency
+
+    async def trial_person(self):
+        scenes = self.config["obs"]["scenes"]
+        cameras = [scene for scene in scenes["list"] if scene not in (scenes["projector_scene"], scenes["ptz_scene"])]
+        scene = cameras[0]
+        self.scenes.occupied = set(cameras)
+        async def person_in_scene():
+            data = await self.get_json("scene_interest_api")
+            return data is not None and data.get("person_in_current_scene") and len(data.get("scenes_with_people", [])) > 1
+        if not await self.prepare(scene, person_in_scene):
+            return None
+        start = time.time()
+        self.scenes.occupied.discard(scene)
+        return await self.cut_after(start)
+
+    async def run(self, scenario):
+        trial = getattr(self, f"trial_{scenario}")
+        latencies, missed = [], 0
+        for number in range(self.args.trials):
+            latency = await trial()
+            if latency is None:
+                missed += 1
+                print(f"{scenario} trial {number + 1}: no cut")
+            else:
+                latencies.append(latency)
+                print(f"{scenario} trial {number + 1}: {latency * 1000:.0f} ms")
+        return {**percentiles(latencies), "missed": missed}
+
+
+async def bench(args):
+    with open(args.config) as file:
+        base_config = json.load(file)
+    config = bench_config(base_config, args.obs_port)
+    scene_config = config["obs"]["scenes"]
+    all_scenes = list(dict.fromkeys(scene_config["list"] + [scene_config["projector_scene"], scene_config["ptz_scene"]]))
+
+    scenarios = args.scenarios.split(",")
+    if "person" in scenarios and not args.person_image:
+        print("No --person-image given, skipping the person scenario")
+        scenarios.remove("person")
+
+    scenes = SyntheticScenes(scene_config["projector_scene"], args.person_image)
+    scenes.occupied = set(scene_config["list"])
+    fake_obs = FakeObs(all_scenes, program_scene=scene_config["list"][0], frame_source=scenes)
+    await fake_obs.start("127.0.0.1", args.obs_port)
+
+    # Every service reads ../config.json relative to its working directory
+    workdir = tempfile.mkdtemp(prefix="latency-bench-")
+    with open(os.path.join(workdir, "config.json"), "w") as file:
+        json.dump(config, file, indent=2)
+    print(f"Service logs: {workdir}")
+    processes = {}
+    session = aiohttp.ClientSession()
+    try:
+        bench_runner = Bench(args, config, fake_obs, scenes, session)
+        for name, (script, api_key) in SERVICES.items():
+            os.makedirs(os.path.join(workdir, name))
+            log = open(os.path.join(workdir, f"{name}.log"), "w")
+            processes[name] = subprocess.Popen([sys.executable, "-u", os.path.join(ROOT, script)],
+                                               cwd=os.path.join(workdir, name), stdout=log, stderr=subprocess.STDOUT)
+            log.close()
+            if api_key is not None:
+                async def up(api_key=api_key):
+                    return await bench_runner.ready(api_key)
+            else:
+                # The director has no API; it's up once it sets its first preview scene
+                async def up():
+                    return len(fake_obs.commands) > 0
+            if not await bench_runner.wait_until(up, args.startup_timeout):
+                raise SystemExit(f"{name} didn't come up, see {workdir}/{name}.log")
+            print(f"Started {name}")
+
+        cpu_start = {name: cpu_seconds(process.pid) for name, process in processes.items()}
+        wall_start = time.time()
+        results = {"scenarios": {}, "cpu_percent": {}, "logs": workdir}
+        for scenario in scenarios:
+            results["scenarios"][scenario] = await bench_runner.run(scenario)
+        wall = time.time() - wall_start
+        for name, process in processes.items():
+            results["cpu_percent"][name] = round((cpu_seconds(process.pid) - cpu_start[name]) / wall * 100, 1)
+    finally:
+        await session.close()
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        await fake_obs.stop()
+
+    print(f"\n{'event':<10} {'n':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'missed':>7}")
+    for scenario, stats in results["scenarios"].items():
+        print(f"{scenario:<10} {stats['count']:>4} {stats.get('p50_ms', '-'):>8} {stats.get('p95_ms', '-'):>8} "
+              f"{stats.get('p99_ms', '-'):>8} {stats['missed']:>7}")
+    print(f"\n{'service':<20} {'CPU %':>6}")
+    for name, percent in results["cpu_percent"].items():
+        print(f"{name:<20} {percent:>6}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure event-to-cut latency of the real services against a fake OBS.")
+    parser.add_argument("--config", default="../config.json", help="Base config; OBS and timing settings are overridden")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--trials", type=int, default=20, help="Trials per scenario")
+    parser.add_argument("--person-image", help="Photo of a person, pasted into camera scenes for the person scenario")
+    parser.add_argument("--obs-port", type=int, default=4466)
+    parser.add_argument("--settle", type=float, default=1.0, help="Seconds to wait after the services agree on the starting state")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="Seconds to wait for each service to come up (model loading)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    asyncio.run(bench(parser.parse_args()))
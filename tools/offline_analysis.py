@@ -0,0 +1,295 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from common.frames import capture_profile
+from interesting_scene.detectors import create_detector, list_images
+from interesting_scene.worker_pool import spawn_pool, limit_threads
+from lyrics_shown.motion import MotionRing, MotionWindow
+
+CHUNK_SECONDS = 60  # Each worker task covers this much of one recording
+PERSON_BATCH = 16  # Frames per detector call
+
+# The detector of this worker process, loaded once when the worker starts
+_detector = None
+
+
+class Recording:
+    """
+    One recorded feed: a video file, or a folder of images taken at
+    `folder_fps` (default `fps`). Frames are sampled at `fps`; the source
+    frame indices of a chunk can be decoded independently, so chunks can go
+    to different workers.
+    """
+
+    def __init__(self, path, fps, folder_fps=None):
+        self.path = path
+        if os.path.isdir(path):
+            self.images = list_images(path)
+            self.source_fps = folder_fps or fps
+            self.frame_count = len(self.images)
+        else:
+            self.images = None
+            capture = cv2.VideoCapture(path)
+            if not capture.isOpened():
+                raise SystemExit(f"Can't open {path}")
+            self.source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            capture.release()
+        # Every step-th source frame is analysed
+        self.step = max(1, round(self.source_fps / fps))
+
+    def chunks(self):
+        """(first, last) source frame ranges of CHUNK_SECONDS each, starting on sampled frames."""
+        size = self.step * max(1, math.ceil(CHUNK_SECONDS * self.source_fps / self.step))
+        return [(first, min(first + size, self.frame_count)) for first in range(0, self.frame_count, size)]
+
+    def frames(self, first, last, size):
+        """Yield (timestamp, BGR frame resized to `size`) for every sampled frame in [first, last)."""
+        if self.images is not None:
+            for index in range(first, last, self.step):
+                frame = cv2.imread(self.images[index])
+                if frame is not None:
+                    yield index / self.source_fps, cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            return
+
+        capture = cv2.VideoCapture(self.path)
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+        try:
+            for index in range(first, last):
+                if (index - first) % self.step:
+                    # Skipped frames are only grabbed, not converted
+                    if not capture.grab():
+                        return
+                    continue
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield index / self.source_fps, cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        finally:
+            capture.release()
+
+
+def _init_worker(detector_config, threads):
+    global _detector
+    if detector_config is not None:
+        _detector = create_detector({**detector_config, "threads": threads})
+    limit_threads(threads, _detector)
+
+
+def _person_task(task):
+    """Highest person confidence of every sampled frame in one chunk of a camera recording."""
+    camera, path, fps, first, last, size = task
+    recording = Recording(path, fps)
+    times, scores, batch = [], [], []
+
+    def flush():
+        scores.extend(_detector.person_scores(batch))
+        batch.clear()
+
+    for timestamp, frame in recording.frames(first, last, size):
+        times.append(timestamp)
+        batch.append(frame)
+        if len(batch) == PERSON_BATCH:
+            flush()
+    if batch:
+        flush()
+    return "person", camera, np.array(times, dtype=np.float32), np.array(scores, dtype=np.float32)
+
+
+def _lyrics_task(task):
+    """
+    Motion score parts of every sampled projector frame in one chunk,
+    compared with the previous sample, as the lyrics service does while
+    capturing at its full rate.
+    """
+    path, fps, folder_fps, first, last, size, lyrics_config = task
+    recording = Recording(path, fps, folder_fps)
+    ring = MotionRing(
+        slots=2,
+        size=tuple(lyrics_config.get("analysis_size", [160, 90])),
+        roi=lyrics_config.get("roi"),
+        pixel_threshold=lyrics_config.get("pixel_threshold", 5),
+        chroma_threshold=lyrics_config.get("chroma_threshold", 40),
+    )
+    # Start a sample early so the first frame of the chunk has something to compare with
+    warmup_first = max(0, first - recording.step)
+    times, changed, colored = [], [], []
+    for timestamp, frame in recording.frames(warmup_first, last, size):
+        ring.push(frame)
+        if ring.count > 1 and timestamp >= first / recording.source_fps:
+            parts = ring.score_parts(1)
+            times.append(timestamp)
+            changed.append(parts[0])
+            colored.append(parts[1])
+    return ("lyrics", None, np.array(times, dtype=np.float32),
+            np.array(changed, dtype=np.float32), np.array(colored, dtype=np.float32))
+
+
+def _run_task(task):
+    kind, arguments = task
+    return _person_task(arguments) if kind == "person" else _lyrics_task(arguments)
+
+
+def analyse(args):
+    with open(args.config) as file:
+        config = json.load(file)
+    detector_config = config.get("interesting_scene", {}).get("detector", {})
+    lyrics_config = config.get("lyrics_shown", {})
+    active_interval = lyrics_config.get("active_interval", 0.2)
+
+    # Frames are analysed at the size the services capture them at
+    person_profile = capture_profile(config, "interesting_scene", width=640, height=360)
+    lyrics_profile = capture_profile(config, "lyrics_shown", width=640, height=360)
+    person_size = (person_profile["width"], person_profile["height"])
+    lyrics_size = (lyrics_profile["width"], lyrics_profile["height"])
+
+    cameras = []
+    tasks = []
+    for spec in args.camera:
+        name, _, path = spec.partition("=")
+        if not path:
+            raise SystemExit(f"--camera takes NAME=PATH, got {spec}")
+        recording = Recording(path, args.fps)
+        for first, last in recording.chunks():
+            tasks.append(("person", (len(cameras), path, args.fps, first, last, person_size)))
+        cameras.append(name)
+    if args.projector:
+        # Sampled at the lyrics service's rate; an image folder was recorded at --fps
+        recording = Recording(args.projector, 1 / active_interval, args.fps)
+        for first, last in recording.chunks():
+            tasks.append(("lyrics", (args.projector, 1 / active_interval, args.fps, first, last, lyrics_size, lyrics_config)))
+    if not tasks:
+        raise SystemExit("Nothing to analyse; pass --camera and/or --projector")
+
+    workers = args.workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    person = {camera: [] for camera in range(len(cameras))}
+    lyrics = []
+    start = time.time()
+    with spawn_pool(workers, threads, _init_worker, (detector_config if args.camera else None, threads)) as pool:
+        for done, result in enumerate(pool.imap_unordered(_run_task, tasks), 1):
+            kind, camera, *columns = result
+            if kind == "person":
+                person[camera].append(columns)
+            else:
+                lyrics.append(columns)
+            print(f"\r{done}/{len(tasks)} chunks, {time.time() - start:.0f}s", end="", flush=True)
+    print()
+
+    # One column per value; person rows are tagged with their camera's index in `cameras`
+    columns = {"cameras": np.array(cameras, dtype=str)}
+    person_rows = [(np.full(len(times), camera, dtype=np.uint8), times, scores)
+                   for camera, chunks in person.items() for times, scores in chunks]
+    if person_rows:
+        camera_column, time_column, score_column = (np.concatenate(column) for column in zip(*person_rows))
+        order = np.lexsort((time_column, camera_column))
+        columns.update(person_camera=camera_column[order], person_time=time_column[order], person_score=score_column[order])
+    if lyrics:
+        time_column, changed_column, colored_column = (np.concatenate(column) for column in zip(*lyrics))
+        order = np.argsort(time_column)
+        columns.update(lyrics_time=time_column[order], lyrics_changed=changed_column[order], lyrics_colored=colored_column[order])
+    columns["meta"] = np.array(json.dumps({
+        "camera_fps": args.fps,
+        "active_interval": active_interval,
+        "compare_window": lyrics_config.get("compare_window", 0.75),
+        "min_moving_pairs": lyrics_config.get("min_moving_pairs", 2),
+        "detector": detector_config,
+        "lyrics_shown": lyrics_config,
+        "analysis_seconds": round(time.time() - start, 1),
+    }))
+    np.savez_compressed(args.out, **columns)
+    print(f"Wrote {args.out} in {time.time() - start:.0f}s")
+
+
+def parse_values(text):
+    """Comma-separated values, or START:STOP:STEP (STOP included)."""
+    if ":" in text:
+        first, last, step = (float(value) for value in text.split(":"))
+        return [round(first + index * step, 6) for index in range(int(round((last - first) / step)) + 1)]
+    return [float(value) for value in text.split(",")]
+
+
+def windowed_scores(times, scores, window, min_moving, interval):
+    """The lyrics service's sliding-window motion score after every frame pair."""
+    motion_window = MotionWindow(window, min_moving)
+    windowed = np.empty(len(scores), dtype=np.float32)
+    # Each pair's frames were taken one sample apart, like the service's consecutive captures
+    gaps = np.diff(times, prepend=times[0] - interval) if len(times) else times
+    for index, (timestamp, score, gap) in enumerate(zip(times, scores, gaps)):
+        motion_window.add(timestamp, score, gap)
+        windowed[index] = motion_window.score()
+    return windowed
+
+
+def transitions(flags, value):
+    """How often a boolean series switches to `value`."""
+    return int(np.count_nonzero((flags[1:] == value) & (flags[:-1] != value)))
+
+
+def sweep(args):
+    """Apply thresholds to the stored raw scores; no frame is decoded and no model is run."""
+    data = np.load(args.results)
+    cameras = list(data["cameras"])
+
+    if "person_score" in data and cameras:
+        print("\nPerson confidence: share of time with a person / times a person left")
+        print(f"{'confidence':>10} " + " ".join(f"{camera[:18]:>18}" for camera in cameras))
+        for confidence in parse_values(args.confidence):
+            cells = []
+            for index in range(len(cameras)):
+                present = data["person_score"][data["person_camera"] == index] > confidence
+                share = present.mean() * 100 if len(present) else 0.0
+                cells.append(f"{share:8.1f}% {transitions(present, False):>8}")
+            print(f"{confidence:>10} " + " ".join(f"{cell:>18}" for cell in cells))
+
+    if "lyrics_changed" in data:
+        print("\nLyrics: share of time lyrics shown / switches to video")
+        meta = json.loads(str(data["meta"]))
+        weights = parse_values(args.color_weight)
+        # The window's score doesn't depend on the threshold, so it's computed once per weight
+        windowed = {weight: windowed_scores(data["lyrics_time"],
+                                            data["lyrics_changed"] + (weight - 1) * data["lyrics_colored"],
+                                            meta.get("compare_window", 0.75), meta.get("min_moving_pairs", 2),
+                                            meta.get("active_interval", 0.2))
+                    for weight in weights}
+        print(f"{'threshold':>10} " + " ".join(f"{'weight ' + str(weight):>18}" for weight in weights))
+        for threshold in parse_values(args.motion_threshold):
+            cells = []
+            for weight in weights:
+                shown = windowed[weight] <= threshold
+                cells.append(f"{shown.mean() * 100:8.1f}% {transitions(shown, False):>8}")
+            print(f"{threshold:>10} " + " ".join(f"{cell:>18}" for cell in cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the person and lyrics detectors over a recorded service, then sweep their thresholds.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyse_parser = commands.add_parser("analyse", help="Decode the recordings and store the raw detector scores")
+    analyse_parser.add_argument("--camera", action="append", default=[], metavar="NAME=PATH",
+                                help="A camera scene and its recording (video file or image folder); repeatable")
+    analyse_parser.add_argument("--projector", help="Recording of the projector scene")
+    analyse_parser.add_argument("--fps", type=float, default=1.0, help="Camera frames analysed per second (and the rate of image folders)")
+    analyse_parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    analyse_parser.add_argument("--config", default="../config.json", help="Detector, capture and lyrics settings")
+    analyse_parser.add_argument("--out", default="analysis.npz")
+
+    sweep_parser = commands.add_parser("sweep", help="Evaluate thresholds against stored scores")
+    sweep_parser.add_argument("results", help=".npz file written by analyse")
+    sweep_parser.add_argument("--confidence", default="0.35:0.75:0.05", help="Person confidences, comma-separated or START:STOP:STEP")
+    sweep_parser.add_argument("--motion-threshold", default="0.05:0.2:0.025", help="Lyrics motion thresholds")
+    sweep_parser.add_argument("--color-weight", default="1", help="Lyrics color weights")
+
+    args = parser.parse_args()
+    if args.command == "analyse":
+        analyse(args)
+    else:
+        sweep(args)
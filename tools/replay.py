@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from aiohttp import web
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from common.events import StateBroadcaster, aiohttp_sse_stream
+from tools.fake_obs import FakeObs
+from tools.stats import percentiles
+
+DIRECTOR = os.path.join(ROOT, "obs_director", "app.py")
+
+# Scene settings that are durations; divided by the replay speed
+SCENE_DURATIONS = ("wait_min", "wait_max", "wait_min_slow", "wait_max_slow")
+
+# Signal changes the director is expected to react to with a cut, by API
+TRIGGERS = {
+    "lyrics_api": lambda old, new: old.get("lyrics_shown") is True and new.get("lyrics_shown") is False,
+    "scene_interest_api": lambda old, new: old.get("person_in_current_scene") and not new.get("person_in_current_scene"),
+    "ptz_moving_api": lambda old, new: not old.get("moving") and new.get("moving"),
+}
+REACTION_WINDOW = 2.0  # Seconds (recording time) within which a cut counts as the reaction to a trigger
+
+
+def load_recording(path):
+    """Split a director recording into its start record, signals, OBS state changes and commands."""
+    start, signals, obs_changes, commands = None, [], [], []
+    with open(path) as file:
+        for line in file:
+            record = json.loads(line)
+            if record["type"] == "start":
+                if start is not None:
+                    break  # The file was appended to by a later session; replay the first one
+                start = record
+            elif record["type"] == "signal":
+                signals.append(record)
+            elif record["type"] == "obs":
+                obs_changes.append(record)
+            elif record["type"] == "command":
+                commands.append(record)
+    if start is None:
+        raise SystemExit(f"{path} has no start record")
+    return start, signals, obs_changes, commands
+
+
+class DetectorStub:
+    """
+    Serves recorded detector payloads on the same endpoints the director
+    polls (`/<api>`) and subscribes to (`/<api>/events`).
+    """
+
+    def __init__(self, keys):
+        self.broadcasters = {key: StateBroadcaster() for key in keys}
+        self._runner = None
+
+    async def start(self, host, port):
+        app = web.Application()
+        for key in self.broadcasters:
+            app.router.add_get(f"/{key}", self._handle_get)
+            app.router.add_get(f"/{key}/events", self._handle_events)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def publish(self, key, data):
+        self.broadcasters[key].publish(data)
+
+    async def _handle_get(self, request):
+        state = self.broadcasters[request.path.strip("/")].state
+        if state is None:
+            return web.json_response({"error": "no data yet"}, status=503)
+        return web.json_response(state)
+
+    async def _handle_events(self, request):
+        broadcaster = self.broadcasters[request.path.strip("/").rsplit("/", 1)[0]]
+        return await aiohttp_sse_stream(request, broadcaster)
+
+
+class Clock:
+    """Maps recording time to replay time, `speed` times faster."""
+
+    def __init__(self, recording_start, replay_start, speed):
+        self.recording_start = recording_start
+        self.replay_start = replay_start
+        self.speed = speed
+
+    def to_replay(self, t):
+        return self.replay_start + (t - self.recording_start) / self.speed
+
+    def to_recording(self, t):
+        return self.recording_start + (t - self.replay_start) * self.speed
+
+
+def scale_payload(key, data, clock):
+    """Compress the time values in a recorded payload to the replay speed."""
+    data = dict(data)
+    if key == "bpm_api":
+        for field in ("current_bpm", "rolling_average_bpm"):
+            if data.get(field):
+                data[field] = data[field] * clock.speed
+    elif key == "beat_api":
+        if data.get("bpm"):
+            data["bpm"] = data["bpm"] * clock.speed
+        if data.get("period"):
+            data["period"] = data["period"] / clock.speed
+        for field in ("beat_time", "downbeat_time", "updated"):
+            if data.get(field) is not None:
+                data[field] = clock.to_replay(data[field])
+        for field in ("next_beats", "next_downbeats"):
+            if field in data:
+                data[field] = [clock.to_replay(t) for t in data[field]]
+    return data
+
+
+def replay_config(recorded_config, obs_port, api_port, speed):
+    """The recorded config pointed at the fake OBS and detector stub, with durations scaled to the replay speed."""
+    config = json.loads(json.dumps(recorded_config))
+    config["obs"]["websocket"] = {"host": "127.0.0.1", "port": obs_port, "password": ""}
+    scenes = config["obs"]["scenes"]
+    for key in SCENE_DURATIONS:
+        scenes[key] = scenes[key] / speed
+    scenes["slow_bpm"] = scenes["slow_bpm"] * speed
+    for key, api in config.items():
+        if key.endswith("_api"):
+            api["url"] = f"http://127.0.0.1:{api_port}/{key}"
+            if "stream_url" in api:
+                api["stream_url"] = f"http://127.0.0.1:{api_port}/{key}/events"
+            api["poll_interval"] = api["poll_interval"] / speed
+            api["check_timeout"] = api.get("check_timeout", 1.0) / speed
+            # The stub serves recorded values from the start, and can't re-check scenes
+            api["ready_url"] = None
+            api["check_url"] = None
+    breaker = config.setdefault("signal_client", {})
+    breaker["reset_timeout"] = breaker.get("reset_timeout", 10) / speed
+    breaker["ready_timeout"] = breaker.get("ready_timeout", 30) / speed
+    # The director's own fixed delays (transition timeout, beat grid age, default BPM, ...)
+    config["director"] = {"time_scale": speed}
+    config["recording"] = {"enabled": False}
+    # Any free port, so the replay doesn't clash with a live director's metrics
+    config["metrics"] = {"director_port": 0}
+    return config
+
+
+# --- Metrics (all in recording time) ---
+
+def reaction_latencies(signals, cut_times):
+    """Time from every trigger signal change to the first cut after it, per API."""
+    latencies = {key: [] for key in TRIGGERS}
+    missed = {key: 0 for key in TRIGGERS}
+    previous = {}
+    cut_times = np.asarray(cut_times)
+    for record in signals:
+        key, data = record["key"], record["data"]
+        trigger = TRIGGERS.get(key)
+        if trigger and key in previous and trigger(previous[key], data):
+            following = cut_times[cut_times >= record["t"]]
+            if len(following) and following[0] - record["t"] <= REACTION_WINDOW:
+                latencies[key].append(following[0] - record["t"])
+            else:
+                missed[key] += 1
+        previous[key] = data
+    return {key: {**percentiles(latencies[key]), "no_cut": missed[key]} for key in TRIGGERS}
+
+
+def empty_shot_time(signals, program_timeline, camera_scenes, start, end):
+    """Seconds a camera scene without people was on program."""
+    # Merge program changes and scene interest updates into one timeline
+    changes = [(t, "program", scene) for t, scene in program_timeline]
+    changes += [(record["t"], "interest", record["data"]) for record in signals if record["key"] == "scene_interest_api"]
+    changes.sort(key=lambda change: change[0])
+
+    program, with_people, empty = None, None, 0.0
+    last_time = start
+    for t, kind, value in changes + [(end, None, None)]:
+        t = min(max(t, start), end)
+        if program in camera_scenes and with_people is not None and program not in with_people:
+            empty += t - last_time
+        last_time = t
+        if kind == "program":
+            program = value
+        elif kind == "interest":
+            with_people = value.get("scenes_with_people", [])
+    return empty
+
+
+def beat_offsets(signals, cut_times):
+    """Distance from every cut during music to the nearest beat of the beat grid current at the time."""
+    grid, music_playing, offsets = None, True, []
+    updates = sorted((record for record in signals if record["key"] in ("beat_api", "bpm_api")), key=lambda record: record["t"])
+    index = 0
+    for cut in sorted(cut_times):
+        while index < len(updates) and updates[index]["t"] <= cut:
+            record = updates[index]
+            if record["key"] == "beat_api":
+                grid = record["data"]
+            else:
+                music_playing = record["data"].get("music_playing", True)
+            index += 1
+        if not music_playing or not grid or not grid.get("period"):
+            continue
+        period = grid["period"]
+        offsets.append(abs((cut - grid["beat_time"] + period / 2) % period - period / 2))
+    return offsets
+
+
+def session_metrics(signals, cut_times, program_timeline, config, start, end, beat_tolerance):
+    scenes = config["obs"]["scenes"]
+    camera_scenes = set(scenes["list"]) - {scenes["projector_scene"]}
+    duration = max(end - start, 1e-9)
+    empty = empty_shot_time(signals, program_timeline, camera_scenes, start, end)
+    offsets = beat_offsets(signals, cut_times)
+    return {
+        "duration_s": round(duration, 1),
+        "cuts": len(cut_times),
+        "cuts_per_minute": round(len(cut_times) / duration * 60, 2),
+        "reaction_latency": reaction_latencies(signals, cut_times),
+        "empty_shot_s": round(empty, 1),
+        "empty_shot_share": round(empty / duration, 3),
+        "beat_offset": {
+            **percentiles(offsets),
+            "on_beat_share": round(float(np.mean(np.asarray(offsets) <= beat_tolerance)), 3) if offsets else None,
+        },
+    }
+
+
+def print_comparison(recorded, replayed):
+    def rows(metrics, prefix=""):
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                yield from rows(value, f"{prefix}{key}.")
+            else:
+                yield f"{prefix}{key}", value
+
+    replayed_rows = dict(rows(replayed))
+    print(f"{'metric':<40} {'recorded':>12} {'replay':>12}")
+    for name, value in rows(recorded):
+        print(f"{name:<40} {str(value):>12} {str(replayed_rows.get(name)):>12}")
+
+
+# --- Replay ---
+
+async def replay(args):
+    start, signals, obs_changes, commands = load_recording(args.recording)
+    recorded_config = start["config"]
+    scenes = recorded_config["obs"]["scenes"]
+    all_scenes = list(dict.fromkeys(scenes["list"] + [scenes["projector_scene"], scenes["ptz_scene"]]))
+    end = max([start["t"]] + [record["t"] for record in signals + obs_changes + commands])
+
+    fake_obs = FakeObs(all_scenes, start["program_scene"], start["preview_scene"],
+                       transition_duration=args.transition_duration / args.speed, frame_source=None)
+    stub = DetectorStub([key for key in recorded_config if key.endswith("_api")])
+    await fake_obs.start("127.0.0.1", args.obs_port)
+    await stub.start("127.0.0.1", args.api_port)
+
+    workdir = tempfile.mkdtemp(prefix="director-replay-")
+    os.makedirs(os.path.join(workdir, "obs_director"))
+    with open(os.path.join(workdir, "config.json"), "w") as file:
+        json.dump(replay_config(recorded_config, args.obs_port, args.api_port, args.speed), file, indent=2)
+    log_path = os.path.join(workdir, "director.log")
+    # The director reads ../config.json relative to its working directory
+    with open(log_path, "w") as log:
+        director = subprocess.Popen([sys.executable, "-u", DIRECTOR], cwd=os.path.join(workdir, "obs_director"),
+                                    stdout=log, stderr=subprocess.STDOUT)
+    print(f"Replaying {len(signals)} signal updates at {args.speed}x, director log: {log_path}")
+    if args.speed != 1:
+        print("Note: OBS round trips, HTTP and event loop delays aren't sped up, so latency and beat "
+              "offsets are only comparable with the recording at --speed 1")
+
+    try:
+        await asyncio.wait_for(fake_obs.identified.wait(), 30)
+        await asyncio.sleep(0.5)  # Let the director subscribe to the detector streams
+        clock = Clock(start["t"], time.time(), args.speed)
+        for record in signals:
+            delay = clock.to_replay(record["t"]) - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stub.publish(record["key"], scale_payload(record["key"], record["data"], clock))
+        await asyncio.sleep(max(0.0, clock.to_replay(end) - time.time()) + args.tail / args.speed)
+    finally:
+        director.terminate()
+        try:
+            director.wait(5)
+        except subprocess.TimeoutExpired:
+            director.kill()
+        await stub.stop()
+        await fake_obs.stop()
+
+    recorded_cuts = [record["t"] for record in commands if record["command"] == "TriggerStudioModeTransition"]
+    recorded_timeline = [(start["t"], start["program_scene"])]
+    recorded_timeline += [(record["t"], record["value"]) for record in obs_changes if record["field"] == "program_scene"]
+    replay_cuts = [clock.to_recording(t) for t, request_type, _ in fake_obs.commands if request_type == "TriggerStudioModeTransition"]
+    replay_timeline = [(clock.to_recording(t), scene) for t, scene in fake_obs.program_history]
+    # The replay covers the same span of recording time as the original session
+    replay_timeline[0] = (start["t"], replay_timeline[0][1])
+
+    results = {
+        "recorded": session_metrics(signals, recorded_cuts, recorded_timeline, recorded_config, start["t"], end, args.beat_tolerance),
+        "replay": session_metrics(signals, replay_cuts, replay_timeline, recorded_config, start["t"], end, args.beat_tolerance),
+    }
+    print_comparison(results["recorded"], results["replay"])
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded director session against a fake OBS and compare the director's decisions.")
+    parser.add_argument("recording", help="JSONL file written with recording enabled")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster than real time")
+    parser.add_argument("--obs-port", type=int, default=4466)
+    parser.add_argument("--api-port", type=int, default=4467)
+    parser.add_argument("--transition-duration", type=float, default=0.3, help="Seconds per transition in the fake OBS, at 1x")
+    parser.add_argument("--tail", type=float, default=5.0, help="Seconds to keep running after the last recorded update")
+    parser.add_argument("--beat-tolerance", type=float, default=0.05, help="Seconds from a beat that still count as on beat")
+    parser.add_argument("--json", help="Also write the metrics to this file")
+    asyncio.run(replay(parser.parse_args()))
@@ -0,0 +1,15 @@
+import numpy as np
+
+
+def percentiles(seconds):
+    """Count, p50/p95/p99 and max of a list of durations in seconds, reported in ms."""
+    if not seconds:
+        return {"count": 0}
+    values = np.asarray(seconds) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "max_ms": round(float(values.max()), 1),
+    }